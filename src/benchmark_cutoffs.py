@@ -0,0 +1,148 @@
+import sys
+import time
+import numpy as np
+import calculate_simi
+import cutoff_binormal
+import find_gmm_cutoff
+import table_cache
+import weighted_sample
+import input_stream
+
+
+def block_similarities(species):
+    table = table_cache.load_dag(species)
+    blocks_avg_sim, _ = calculate_simi.summarize_blocks(table)
+    data = []
+    for block in blocks_avg_sim:
+        data.append(float(format(block[3], ".2f")))
+    return np.array(data).reshape(-1, 1)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def scan_cutoff(score_samples, data):
+    # The former search, which scores both sides of every candidate.
+    # It is O(n^2) and only kept as the reference of search_cutoff.
+    max_likelihood = -np.inf
+    optimal_cutoff = None
+
+    for cutoff in data:
+        left_component = data[data < cutoff].reshape(-1, 1)
+        right_component = data[data >= cutoff].reshape(-1, 1)
+
+        # filter the first data point
+        if not len(left_component):
+            continue
+
+        # Calculate the log-likelihood of each component
+        left_likelihood = score_samples(left_component).sum()
+        right_likelihood = score_samples(right_component).sum()
+
+        # Calculate the total likelihood
+        total_likelihood = left_likelihood * right_likelihood
+
+        # Update the maximum likelihood and cutoff if necessary
+        if total_likelihood > max_likelihood:
+            max_likelihood = total_likelihood
+            optimal_cutoff = cutoff
+
+    return optimal_cutoff
+
+
+def bench_gmm_cutoff(species):
+    # Return whether both searches give the same cutoff.
+    data = block_similarities(species)
+    sample = weighted_sample.from_data(data)
+    gmm = weighted_sample.fit_gmm(sample)
+    score_samples = lambda x: weighted_sample.gmm_score_samples(gmm, x)
+
+    scanned, scan_time = timed(scan_cutoff, score_samples, data)
+    searched, search_time = timed(find_gmm_cutoff.search_cutoff, 
+                                  score_samples, sample)
+    same = str(scanned) == str(searched)
+    print(f"{input_stream.species_name(species)}\t{len(data)}\t"
+          f"{scan_time:.4f}\t{search_time:.4f}\t"
+          f"{scan_time / search_time:.1f}x\t{searched}\t"
+          f"{'yes' if same else 'NO'}")
+    return same
+
+
+def scan_node(sample, nodes):
+    # The former binormal search, which fits both sides of every node.
+    # It is only kept as the reference of cutoff_binormal.first_best_node.
+    best_mle_score = float('-inf')
+    best_node = None
+    for node in nodes:
+        data_before_node, data_after_node = weighted_sample.split(sample, node)
+        if weighted_sample.size(data_before_node) <= 0:
+            continue
+
+        # A side without spread gets a nan score and is skipped.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fit_before_node = weighted_sample.norm_fit(data_before_node)
+            fit_after_node = weighted_sample.norm_fit(data_after_node)
+            mle = weighted_sample.norm_pdf_sum(data_before_node, 
+                                               *fit_before_node) + \
+                weighted_sample.norm_pdf_sum(data_after_node, 
+                                             *fit_after_node)
+
+        if mle > best_mle_score:
+            best_mle_score = mle
+            best_node = node
+    return best_node
+
+
+def bench_binormal_node(species):
+    # Return whether both searches give the same node in both modes.
+    sample = weighted_sample.from_data(block_similarities(species))
+    same_modes = True
+    for mode in ["grid", "unique"]:
+        if mode == "unique":
+            nodes = sample.values
+        else:
+            nodes = np.linspace(sample.values[0], sample.values[-1], 100)
+
+        scanned, scan_time = timed(scan_node, sample, nodes)
+        searched, search_time = timed(cutoff_binormal.first_best_node, 
+                                      sample, nodes)
+        same = scanned == searched
+        same_modes = same_modes and same
+        print(f"{input_stream.species_name(species)}\t{mode}\t{len(nodes)}\t"
+              f"{scan_time:.4f}\t{search_time:.4f}\t"
+              f"{scan_time / search_time:.1f}x\t{searched}\t"
+              f"{'yes' if same else 'NO'}")
+    return same_modes
+
+
+def main(args):
+    species_list = input_stream.parse_species_list(args)
+    if species_list is None or len(species_list) <= 0:
+        print("No valid input.")
+        return 1
+
+    print(f"\n===================  GMM cutoff search  ===================")
+    print("Species\tBlocks\tScan (s)\tSearch (s)\tSpeedup\tCutoff\tSame")
+    failed = 0
+    for species in species_list:
+        if not bench_gmm_cutoff(species):
+            failed += 1
+
+    print(f"\n===================  Binormal node search  ===================")
+    print("Species\tMode\tNodes\tScan (s)\tSearch (s)\tSpeedup\tNode\tSame")
+    for species in species_list:
+        if not bench_binormal_node(species):
+            failed += 1
+
+    if failed > 0:
+        print(f"{failed} checks got another cutoff than the former search.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # python3 benchmark_cutoffs.py ../data/paralogs_outputs/
+    sys.exit(main(sys.argv))
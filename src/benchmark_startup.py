@@ -0,0 +1,93 @@
+import os
+import sys
+import subprocess
+
+
+# The scripts run from the command line.
+ENTRY_POINTS = ["calculate_simi", "extract_singletons", "extract_triple_dis",
+                "pipeline", "remove_dup", "sweep_cutoffs", "triplet_sim_dist"]
+# Modules an entry point should not load before it needs them.
+HEAVY_MODULES = ["scipy", "matplotlib", "sklearn", "fitter", "pandas"]
+REPEATS = 3
+
+
+def import_times(entry, current_dir):
+    """
+    Import entry in a fresh interpreter under python -X importtime.
+    Return (name, depth, cumulative us) of every import, in the order
+    they finished. The entry point itself has depth 0, what it imports
+    depth 1 and so on.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime",
+                             "-c", f"import {entry}"],
+                            cwd=current_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Failed to import {entry}:\n{result.stderr}")
+        return None
+
+    records = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append((name.strip(), depth, int(fields[1])))
+    return records
+
+
+def entry_imports(records, entry):
+    # The cumulative time of the entry point and of its direct imports,
+    # which are listed just before it.
+    for i in range(len(records) - 1, -1, -1):
+        name, depth, cumulative = records[i]
+        if name == entry and depth == 0:
+            break
+    else:
+        return 0, []
+
+    direct = []
+    for name, depth, us in reversed(records[:i]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append((name, us))
+    return cumulative, sorted(direct, key=lambda item: -item[1])
+
+
+def bench_entry(entry, current_dir, repeats = REPEATS, top = 3):
+    # The fastest of the runs, the later ones have warm file caches.
+    best = None
+    for _ in range(repeats):
+        records = import_times(entry, current_dir)
+        if records is None:
+            return
+        total, direct = entry_imports(records, entry)
+        if best is None or total < best[0]:
+            best = (total, direct, records)
+
+    total, direct, records = best
+    loaded = set(name.split(".")[0] for name, _, _ in records)
+    heavy = [module for module in HEAVY_MODULES if module in loaded]
+    heaviest = ", ".join(f"{name} {us / 1000:.1f}" for name, us in direct[:top])
+    print(f"{entry}\t{total / 1000:.1f}\t{len(records)}\t"
+          f"{','.join(heavy) if heavy else '-'}\t{heaviest}")
+
+
+def main(args):
+    entries = args[1:] if len(args) > 1 else ENTRY_POINTS
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+
+    print(f"\n===================  Startup imports  ===================")
+    print("Entry point\tImport (ms)\tModules\tHeavy modules\t"
+          "Heaviest imports (ms)")
+    for entry in entries:
+        bench_entry(entry, current_dir)
+
+
+if __name__ == "__main__":
+    # python3 benchmark_startup.py
+    # python3 benchmark_startup.py calculate_simi pipeline
+    main(sys.argv)
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import tempfile
+import dag_parser
+import extract_triple_dis
+import table_cache
+import input_stream
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def anchor_fields(line):
+    # The two "||" columns of an anchor line, None for any other line.
+    line = line.strip()
+    if not line or line.startswith(b"#"):
+        return None
+    fields = line.split(b'\t')
+    if len(fields) != 12:
+        return None
+    chain_info = fields[3].split(b'||')
+    chain_info_2 = fields[7].split(b'||')
+    if len(chain_info) != 9 or len(chain_info_2) != 9:
+        return None
+    return chain_info, chain_info_2
+
+
+def scan_pairs(file_path):
+    """
+    The former pair store, {(fid, fid): identity in centi-percents}, read
+    from the lines of the file as the former triplet parser did: every
+    anchor line counts, whatever the genome sequences of its block, and
+    the first line of a pair gives its identity.
+    """
+    genome_pair_sim = {}
+    for line in input_stream.read_lines(file_path):
+        chains = anchor_fields(line)
+        if chains is None:
+            continue
+        genome_segment = int(chains[0][6])
+        genome_segment_2 = int(chains[1][6])
+        new_pair = (min(genome_segment, genome_segment_2),
+                    max(genome_segment, genome_segment_2))
+        if new_pair not in genome_pair_sim:
+            genome_pair_sim[new_pair] = dag_parser.parse_pid(chains[0][8])
+    return genome_pair_sim
+
+
+def write_mixed_copy(file_path, mixed_file, n_rows = 50):
+    """
+    Copy the file with up to n_rows anchor lines of other genome sequences
+    put after the first anchor of the first block, i.e. lines the block
+    table marks as "mixed". They are taken evenly over the file, so their
+    pairs come first and the order of the triplets changes unless these
+    lines are taken. Return how many were put.
+    """
+    lines = list(input_stream.read_lines(file_path))
+    anchors = [i for i, line in enumerate(lines) 
+               if anchor_fields(line) is not None]
+    if len(anchors) == 0:
+        return 0
+    first = anchors[0]
+    genomes = lambda i: (anchor_fields(lines[i])[0][0], 
+                         anchor_fields(lines[i])[1][0])
+    others = [i for i in anchors if genomes(i) != genomes(first)]
+    step = max(len(others) // n_rows, 1)
+    mixed = [lines[i].rstrip(b"\r\n") + b"\n" for i in others[::step][:n_rows]]
+    with open(mixed_file, 'wb') as fout:
+        fout.writelines(lines[:first + 1] + mixed + lines[first + 1:])
+    return len(mixed)
+
+
+def scan_triples(genome_pair_sim):
+    """
+    The former triangle enumeration over sets, only kept as the reference
+    of extract_triple_dis.find_triples. Return the (fids, sims) of every
+    triplet in the former order of discovery.
+    """
+    adjacency = {}
+    pair_index = {}
+    for index, pair in enumerate(genome_pair_sim):
+        pair_index[pair] = index
+        if pair[0] == pair[1]:
+            continue
+        for element, other in (pair, pair[::-1]):
+            if element not in adjacency:
+                adjacency[element] = set()
+            adjacency[element].add(other)
+
+    # Orient each edge from the lower (degree, element) rank to the higher.
+    ordered = sorted(adjacency, key=lambda e: (len(adjacency[e]), e))
+    rank = {}
+    for i, element in enumerate(ordered):
+        rank[element] = i
+    forward = {}
+    for element in ordered:
+        forward[element] = set([other for other in adjacency[element]
+                                if rank[other] > rank[element]])
+
+    triangles = []
+    for element in ordered:
+        for other in forward[element]:
+            for third in forward[element] & forward[other]:
+                triangles.append(tuple(sorted([element, other, third])))
+
+    # The pairwise scan found (a, b, c) at the first (pair1, pair2) among
+    # ((a, b), (a, c)), ((a, b), (b, c)) and ((a, c), (b, c)).
+    def discovery_order(triangle):
+        ab = pair_index[(triangle[0], triangle[1])]
+        ac = pair_index[(triangle[0], triangle[2])]
+        bc = pair_index[(triangle[1], triangle[2])]
+        if ab < ac:
+            return (ab, min(ac, bc))
+        return (ac, bc)
+
+    triangles.sort(key=discovery_order)
+    sims = [[genome_pair_sim[(a, b)], genome_pair_sim[(a, c)],
+             genome_pair_sim[(b, c)]] for a, b, c in triangles]
+    return triangles, sims
+
+
+def bench_triplets(name, file_path, table):
+    # Return whether both enumerations give the same triplets in order.
+    genome_pair_sim = scan_pairs(file_path)
+    (fids, sims), scan_time = timed(scan_triples, genome_pair_sim)
+    triples, search_time = timed(lambda: extract_triple_dis.find_triples(
+        extract_triple_dis.traverse_each_species(table)))
+
+    same = triples["fids"].tolist() == [list(fid) for fid in fids] and \
+        triples["sims"].tolist() == sims
+    print(f"{name}\t{len(table['fid1'])}\t"
+          f"{len(fids)}\t{scan_time:.4f}\t{search_time:.4f}\t"
+          f"{scan_time / search_time:.1f}x\t{'yes' if same else 'NO'}")
+    return same
+
+
+def bench_species(species):
+    # The file itself, then a copy with mixed rows, which the triplets
+    # take unlike the other stages. Return how many checks failed.
+    name = input_stream.species_name(species)
+    failed = 0
+    if not bench_triplets(name, species, table_cache.load_dag(species)):
+        failed += 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mixed_file = os.path.join(tmp_dir, name)
+        n_mixed = write_mixed_copy(species, mixed_file)
+        # not cached, the copy is gone after the check
+        table = dag_parser.parse_dag(mixed_file)
+        if int(table["mixed"].sum()) != n_mixed:
+            print(f"{name}: {int(table['mixed'].sum())} mixed rows in the "
+                  f"table, {n_mixed} put.")
+            failed += 1
+        if not bench_triplets(f"{name} +{n_mixed} mixed", mixed_file, table):
+            failed += 1
+    return failed
+
+
+def main(args):
+    species_list = input_stream.parse_species_list(args)
+    if species_list is None or len(species_list) <= 0:
+        print("No valid input.")
+        return 1
+
+    print(f"\n===================  Triplet enumeration  ===================")
+    print("Species\tAnchors\tTriplets\tScan (s)\tSearch (s)\tSpeedup\tSame")
+    failed = 0
+    for species in species_list:
+        failed += bench_species(species)
+
+    if failed > 0:
+        print(f"{failed} checks got other triplets than the former scan.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # python3 benchmark_triplets.py ../data/paralogs_outputs/
+    sys.exit(main(sys.argv))
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import weighted_sample
+
+
+def resample(sample, rng):
+    # Drawing n points with replacement from the data is drawing the new
+    # counts of the unique values from a multinomial.
+    n = weighted_sample.size(sample)
+    counts = rng.multinomial(n, sample.counts / n)
+    keep = counts > 0
+    return weighted_sample.WeightedSample(sample.values[keep], counts[keep])
+
+
+def run_replicates(sample, statistic, seeds):
+    results = []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        value = statistic(resample(sample, rng))
+        results.append(np.nan if value is None else float(np.ravel(value)[0]))
+    return results
+
+
+def bootstrap(sample, statistic, n_bootstrap, seed = 0, jobs = None):
+    """
+    Evaluate statistic (a picklable function of a WeightedSample) on
+    n_bootstrap resamples of the sample in a process pool. Every replicate
+    has its own seed spawned from seed, so the results do not depend on
+    the number of jobs. A replicate without a result gives nan.
+    """
+    sample = weighted_sample.as_sample(sample)
+    seeds = np.random.SeedSequence(seed).spawn(n_bootstrap)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, n_bootstrap))
+    if jobs == 1:
+        return np.array(run_replicates(sample, statistic, seeds))
+
+    # A few chunks per worker to even out the load.
+    n_chunks = min(n_bootstrap, jobs * 4)
+    chunks = np.array_split(np.arange(n_bootstrap), n_chunks)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_replicates, sample, statistic,
+                                   [seeds[i] for i in chunk])
+                   for chunk in chunks]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+    return np.array(results)
+
+
+def percentile_interval(values, confidence = 0.95):
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return (None, None)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(values, [tail, 100 - tail])
+    return (float(low), float(high))
+
+
+def format_interval(values, confidence = 0.95):
+    low, high = percentile_interval(values, confidence)
+    valid = int(np.sum(~np.isnan(values)))
+    return (f"Bootstrap {confidence * 100:g}% interval: [{low}, {high}] "
+            f"({valid} of {len(values)} replicates)")
@@ -1,127 +1,112 @@
 import re
 import os
 import sys
-import matplotlib.pyplot as plt
-import fit
+import functools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import fit_gmm
 import find_gmm_cutoff
 import cutoff_binormal
+import dag_parser
+import table_cache
+import weighted_sample
+import online_stats
+import species_pool
+import input_stream
 
 def parse_dagchainer_output(file_path, debug_rows_count = 0):
-    with open(file_path, 'r') as file:
-        # global initialization
-        row_id = 0
-        blocks_avg_sim = []
-        genome_default = "CURR"
-        genome_default_2 = "CURR_2"
-
-        # block initialization
-        current_genome_seq = genome_default
-        current_genome_seq_2 = genome_default_2
-        block_sim_sum = 0
-        block_count = 0
-        
-        # to record single similarity
-        block_id = 0
-        each_simi_dict = {}
-
-        for line in file:
-            row_id += 1
-            line = line.strip()
-
-            # For debug
-            if debug_rows_count > 0 and row_id == debug_rows_count:
-                break
-            
-            if not line:
-                continue
-
-            # new block single
-            if line.startswith("#Ks"):
-                block_id += 1
-
-            # If starts with "#", new block starts.
-            # Thus calculate the average of last block.
-            if line.startswith("#"):
-                if block_count <= 0:
-                    # print(f"Skip line {row_id} which should be the starting.")
-                    continue
-                # calculate the average similarity
-                blocks_avg_sim.append((current_genome_seq, 
-                                       current_genome_seq_2, 
-                                       block_count, 
-                                       block_sim_sum / block_count))
-                    
-                # re-init
-                current_genome_seq = genome_default
-                current_genome_seq_2 = genome_default_2
-                block_sim_sum = 0
-                block_count = 0
-
-            # check data validation
-            fields = line.split('\t')
-            if len(fields) != 12:
-                if not line.startswith("#"):
-                    print(f"Invalid line {row_id} with {len(fields)} fields.")
-                continue
-
-            # chr1||start1||stop1||name1||strand1||type1||db_feature_id1||genome_order1||percent_id1
-            # chr2||start2||stop2||name2||strand2||type2||db_feature_id2||genome_order2||percent_id2
-            chain_info = fields[3].split('||')
-            chain_info_2 = fields[7].split('||')
-            if len(chain_info) != 9 or len(chain_info_2) != 9:
-                print(f"Invalid line {row_id} with fault \
-                      columns for the two genome sequence.")
-                continue
-            # Since the file records paralog, chr1 should be equal to chr2.
-            # if chain_info[0] != chain_info_2[0]:
-            #     print(f"Invalid line {row_id} with different genome comparison.")
-            #     continue
-            
-            genome_seq = chain_info[0]
-            genome_seq_2 = chain_info_2[0]
-            # The genome sequence within a block should be the same.
-            if current_genome_seq != genome_default \
-                and genome_seq != current_genome_seq:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence within current block")
-                continue
-            if current_genome_seq_2 != genome_default_2 \
-                and genome_seq_2 != current_genome_seq_2:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence 2 within current block")
-                continue
-
-            current_genome_seq = genome_seq
-            current_genome_seq_2 = genome_seq_2
-            percent_id1 = float(chain_info[-1])
-            block_sim_sum += percent_id1
-            block_count += 1
-
-            # single
-            if block_id not in each_simi_dict:
-                each_simi_dict[block_id] = []
-            each_simi_dict[block_id].append(percent_id1)
+    table = dag_parser.parse_dag(file_path, debug_rows_count)
+    return summarize_blocks(table)
+
+
+def block_similarities(table):
+    """
+    The identities (in centi-percents) of the anchors of every block, as
+    one array of all the anchors and the offsets of the blocks in it:
+    block i (from 0) is simis[offsets[i]:offsets[i + 1]]. Both are the
+    columns of the table, not copies.
+    """
+    return {"simis": table["pid1"], "offsets": table["block_offsets"]}
+
+
+def summarize_blocks(table):
+    # The rows of another genome sequence than their block's are left out.
+    table = dag_parser.drop_mixed_rows(table)
+    blocks_avg_sim = []
+    # to record single similarity
+    block_simis = block_similarities(table)
+
+    chromosomes = table["chromosomes"]
+    offsets = table["block_offsets"]
+    chr1 = table["chr1"]
+    chr2 = table["chr2"]
+    pid1 = table["pid1"]
+
+    for i in range(dag_parser.closed_block_count(table)):
+        start = offsets[i]
+        stop = offsets[i + 1]
+        simis = dag_parser.pid_value(pid1[start:stop]).tolist()
+
+        # calculate the average similarity
+        block_count = len(simis)
+        blocks_avg_sim.append((chromosomes[chr1[start]], 
+                               chromosomes[chr2[start]], 
+                               block_count, 
+                               sum(simis) / block_count))
     
-    return blocks_avg_sim, each_simi_dict
+    return blocks_avg_sim, block_simis
 
 
-def save_similarity(output_file, blocks_avg_sim):
+def save_similarity(output_file, blocks_avg_sim, expand = False):
+    """
+    One row per block, weighted by its Block Size, the number of anchor
+    pairs of the block. expand=True writes the legacy layout instead, with
+    the row of every block repeated once per anchor pair.
+    """
     with open(output_file, 'w') as out:
+        write_similarity_header(out, expand)
+        for block in blocks_avg_sim:
+            write_similarity_block(out, block, expand)
+
+def save_expanded_similarity(output_file, blocks_avg_sim):
+    save_similarity(output_file, blocks_avg_sim, True)
+
+def write_similarity_header(out, expand = False):
+    if expand:
         out.write(f"Genome Sequence\tGenome Sequence 2\t\
                   Block Size\tAverage Percent Identity\n")
-        for block in blocks_avg_sim:
-            for i in range(block[2]):
-                out.write(f"{block[0]}\t{block[1]}\t\
-                          {block[2]}\t{block[3]: .2f}\n")
+    else:
+        out.write("Genome Sequence\tGenome Sequence 2\tBlock Size\t"
+                  "Average Percent Identity\n")
 
-def draw_sim_plot(species, block_sim_data, plot_saving_file):
-    data = []
+def write_similarity_block(out, block, expand = False):
+    if expand:
+        for i in range(block[2]):
+            out.write(f"{block[0]}\t{block[1]}\t\
+                          {block[2]}\t{block[3]: .2f}\n")
+    else:
+        out.write(f"{block[0]}\t{block[1]}\t{block[2]}\t"
+                  f"{block[3]:.2f}\n")
+
+def similarity_sample(block_sim_data):
+    # The block similarities rounded to two decimals, as unique values
+    # weighted by their counts, shared by all the fitting routines.
+    return weighted_sample.from_fixed_point(block_pids(block_sim_data), 
+                                            dag_parser.PID_SCALE)
+
+def block_pids(block_sim_data):
+    # The block similarities rounded to two decimals, in centi-percents.
+    pids = []
     for block in block_sim_data:
-        data.append(float(format(block[3], ".2f")))
-    
+        pids.append(dag_parser.parse_pid(format(block[3], ".2f")))
+    return pids
+
+def draw_sim_plot(species, sample, plot_saving_file):
+    # matplotlib takes longer to import than the rest, only plots need it.
+    import matplotlib.pyplot as plt
     plt.clf()
-    plt.hist(data, bins=20, edgecolor='black', alpha=0.7)
+    plt.hist(sample.values, weights=sample.counts, 
+             bins=20, edgecolor='black', alpha=0.7)
     plt.xlabel('Values')
     plt.ylabel('Frequency')
     plt.title(f"Similarity Distribution Plot of {species}")
@@ -129,63 +114,31 @@ def draw_sim_plot(species, block_sim_data, plot_saving_file):
     plt.savefig(plot_saving_file)
     # plt.show()
 
-def fit_similarity(block_sim_data, fit_file, fit_paras_file):
-    data = []
-    for block in block_sim_data:
-        data.append(float(format(block[3], ".2f")))
-    fit.simulate_distribution(data, fit_file, fit_paras_file)
+def fit_similarity(sample, fit_file, fit_paras_file):
+    # fitter pulls in pandas, import it only when it is used.
+    import fit
+    fit.simulate_distribution(sample, fit_file, fit_paras_file)
 
-def fit_gmm_similarity(block_sim_data, fit_file, fit_gmm_paras_file):
-    data = []
-    for block in block_sim_data:
-        data.append(float(format(block[3], ".2f")))
-    fit_gmm.fit_gmm(data, fit_file, fit_gmm_paras_file)
+def fit_gmm_similarity(sample, fit_file, fit_gmm_paras_file):
+    fit_gmm.fit_gmm(sample, fit_file, fit_gmm_paras_file)
 
-def find_gmm_cutoffs(block_sim_data, gmm_cutoffs_file):
-    data = []
-    for block in block_sim_data:
-        data.append(float(format(block[3], ".2f")))
-    find_gmm_cutoff.find_gmm_cutoff(data, gmm_cutoffs_file)
+def find_gmm_cutoffs(sample, gmm_cutoffs_file, n_bootstrap = 0):
+    find_gmm_cutoff.find_gmm_cutoff(sample, gmm_cutoffs_file, n_bootstrap)
 
-def find_binormal_cutoffs(block_sim_data, 
+def find_binormal_cutoffs(sample, 
                           binormal_cutoffs_parameters, 
-                          binormal_cutoffs_plot):
-    data = []
-    for block in block_sim_data:
-        data.append(float(format(block[3], ".2f")))
-    return cutoff_binormal.measure_by_mle(data, 
+                          binormal_cutoffs_plot, 
+                          mode = "grid", 
+                          n_bootstrap = 0):
+    return cutoff_binormal.measure_by_mle(sample, 
                                    binormal_cutoffs_parameters, 
-                                   binormal_cutoffs_plot)
+                                   binormal_cutoffs_plot, 
+                                   mode, 
+                                   n_bootstrap)
 
-def parse_species_list(args):
-    species_list = []
-    
-    if len(args) < 2:
-        print("Please provide a file, "
-              "or several files with semicolon as separator, "
-              "or folder as an argument.")
-    else:
-        paths = sys.argv[1:]
-        print(f"Your input path: {paths}.\n")
-        for path in paths:
-            if os.path.isfile(path):
-                species_list.append(path)
-            elif os.path.isdir(path):
-                for root, _, files in os.walk(path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        species_list.append(file_path)
-            else:
-                filenames = path.split(";")
-                for filename in filenames:
-                    if os.path.isfile(filename):
-                        species_list.append(filename)
-                    else:
-                        print(f"Invalid file: {filename} "
-                              "inside the list you input.")
-                        
-    return species_list
 
+# Kept for the scripts that still call it here.
+parse_species_list = input_stream.parse_species_list
 
 def judge_side(similarity, cutoff):
     if similarity <= cutoff:
@@ -194,59 +147,271 @@ def judge_side(similarity, cutoff):
         return "t2"
 
 
-def stat_pair_t1(simi_file, cutoff, t1_stat_file):
-    row_id = 0
-    t1_count = {}
-
-    with open(simi_file, 'r') as fin, \
-        open(t1_stat_file, 'w') as fout:
-        for line in fin:
-            row_id += 1
-            if not line or row_id <= 1:
-                continue
-
-            fields = line.strip().split("\t")
-            if len(fields) != 4:
-                print(f"Invalid line in similarity file, line {row_id}, not 4 fields.")
-                continue
-            
-            similarity = float(fields[3])
-            theside = judge_side(similarity, cutoff)
-            if theside not in t1_count:
-                t1_count[theside] = 0
-            t1_count[theside] += 1
-        
-        sorted_t1_count = {"t1": t1_count["t1"], "t2": t1_count["t2"]}
-        fout.write(f"Pair Statistics: {sorted_t1_count}\n")
-
-
-def stat_pair_between_t1(each_simi_dict, cutoff, another_t1_file):
-    t1_count = {}
-    # original_count = 0
-    # between_count = 0
+def stat_pair_t1(blocks_avg_sim, cutoff, t1_stat_file):
+    # Every anchor pair of a block is on the side of the block similarity,
+    # rounded as in the .similarity file.
+    pid_cutoff = dag_parser.pid_cutoff(cutoff)
+    t1_count = {"t1": 0, "t2": 0}
+    for block, pid in zip(blocks_avg_sim, block_pids(blocks_avg_sim)):
+        t1_count[judge_side(pid, pid_cutoff)] += block[2]
+
+    with open(t1_stat_file, 'w') as fout:
+        fout.write(f"Pair Statistics: {t1_count}\n")
+
+
+def between_pid_sums(block_simis):
+    # The sum of the identities of every two neighbouring anchors of a 
+    # block, but the last two of each block, for all the blocks at once. 
+    # Twice their average, in centi-percents.
+    simis = block_simis["simis"].astype(np.int32)
+    offsets = block_simis["offsets"]
+    if len(simis) < 2:
+        return np.empty(0, dtype=np.int32)
+    block_stops = np.repeat(offsets[1:], np.diff(offsets))
+    firsts = np.arange(len(simis) - 1)
+    valid = firsts + 2 < block_stops[:-1]
+    return (simis[:-1] + simis[1:])[valid]
+
+
+def stat_pair_between_t1(block_simis, cutoff, another_t1_file):
+    pid_sums = between_pid_sums(block_simis)
+    t1 = int(np.count_nonzero(pid_sums <= dag_parser.pid_cutoff(cutoff, 2)))
+    t1_count = {"t1": t1, "t2": len(pid_sums) - t1}
+    with open(another_t1_file, 'w') as fout:
+        fout.write(f"Another Pair Statistics: {t1_count}\n")
+
+
+# The accumulators count identities in centi-percents, any uint16 one, and
+# the between pairs by the sum of their two identities.
+PID_BINS = 1 << 16
+PID_SUM_BINS = 2 * PID_BINS - 1
+
+def new_block_stats():
+    """
+    The running statistics of add_block, in constant memory, as
+    online_stats accumulators: the block similarities rounded as in the
+    .similarity file, once per closed block ("blocks") and once per anchor
+    pair ("pairs"), and the neighbour sums of between_pid_sums ("between",
+    valued as their averages).
+    """
+    return {
+        "blocks": online_stats.new_accumulator(PID_BINS, dag_parser.PID_SCALE),
+        "pairs": online_stats.new_accumulator(PID_BINS, dag_parser.PID_SCALE),
+        "between": online_stats.new_accumulator(PID_SUM_BINS, 
+                                                2 * dag_parser.PID_SCALE),
+    }
+
+def merge_block_stats(stats, other):
+    for name in stats:
+        online_stats.merge(stats[name], other[name])
+    return stats
+
+def add_block(stats, block):
+    """
+    Add a block of dag_parser.iter_blocks to stats and return its average
+    similarity, as summarize_blocks does. The last block, if no "#" line
+    closes it, only counts for the between pairs and gives None.
+    """
+    pids = block["pid1"]
+    online_stats.add(stats["between"], 
+                     between_pid_sums({"simis": pids, 
+                                       "offsets": np.array([0, len(pids)])}))
+    if not block["closed"]:
+        return None
+
+    simis = dag_parser.pid_value(pids).tolist()
+    average = sum(simis) / len(simis)
+    pid = dag_parser.parse_pid(format(average, ".2f"))
+    online_stats.add(stats["blocks"], [pid])
+    online_stats.add(stats["pairs"], [pid], [len(simis)])
+    return average
+
+def stat_stream_t1(stats, cutoff, t1_stat_file, another_t1_file):
+    # stat_pair_t1 and stat_pair_between_t1 out of the accumulators.
+    pairs = stats["pairs"]
+    t1 = online_stats.count_at_most(pairs, dag_parser.pid_cutoff(cutoff))
+    t1_count = {"t1": t1, "t2": pairs["count"] - t1}
+    with open(t1_stat_file, 'w') as fout:
+        fout.write(f"Pair Statistics: {t1_count}\n")
+
+    between = stats["between"]
+    t1 = online_stats.count_at_most(between, dag_parser.pid_cutoff(cutoff, 2))
+    t1_count = {"t1": t1, "t2": between["count"] - t1}
     with open(another_t1_file, 'w') as fout:
-        for block_id in each_simi_dict:
-            simis = each_simi_dict[block_id]
-            # original_count += len(simis)
-            for i in range(1, len(simis) - 1):
-                # between_count += 1
-                avg_simi = (simis[i-1] + simis[i]) / 2.0
-                theside = judge_side(avg_simi, cutoff)
-                if theside not in t1_count:
-                    t1_count[theside] = 0
-                t1_count[theside] += 1
-        
-        # print(f"original_count = {original_count}, between_count = {between_count}")
-        
-        sorted_t1_count = {"t1": t1_count["t1"], "t2": t1_count["t2"]}
-        fout.write(f"Another Pair Statistics: {sorted_t1_count}\n")
+        fout.write(f"Another Pair Statistics: {t1_count}\n")
 
 
 def remove_duplicate(original_file, filtered_file):
     return
 
+def extract_pairs(input_file, output_prefix, parse_jobs = 1, 
+                  expand_similarity = False):
+    # The pairs stage, the block similarities saved to <prefix>.similarity.
+    table = table_cache.load_dag(input_file, parse_jobs)
+    blocks_avg_sim, block_simis = summarize_blocks(table)
+
+    # Print extracted chain information
+    output_file = output_prefix + '.similarity'
+    save_similarity(output_file, blocks_avg_sim, expand_similarity)
+    return blocks_avg_sim, block_simis
+
+
+def stream_range(input_file, start, stop, last):
+    """
+    The .similarity rows and the new_block_stats of the blocks in the
+    byte range [start, stop) of a split_points split, with the invalid
+    lines and the number of lines read, as parse_range gives them. The
+    last block of a range is closed by the first "#" line of the next.
+    """
+    scan = dag_parser.new_scan(start)
+    stats = new_block_stats()
+    rows = []
+    for block in dag_parser.iter_blocks(input_file, 0, start, stop, scan):
+        if not last:
+            block["closed"] = True
+        average = add_block(stats, block)
+        if average is not None:
+            rows.append((block["genome_seq"], block["genome_seq_2"], 
+                         block["size"], average))
+    return rows, stats, scan["messages"], scan["row_id"]
+
+
+def stream_pairs(input_file, output_prefix, expand_similarity = False, 
+                 parse_jobs = 1):
+    """
+    extract_pairs one block at a time, without a table: the .similarity
+    rows are written as the blocks are read, and only the running
+    statistics of new_block_stats are kept for find_stream_cutoffs.
+    With parse_jobs > 1 the ranges of dag_parser.split_points are read in
+    that many processes, and their rows written and statistics merged in
+    order. Only the rows, one per block, are held until then.
+    """
+    output_file = output_prefix + '.similarity'
+    if parse_jobs <= 1 or not input_stream.is_plain(input_file):
+        stats = new_block_stats()
+        with open(output_file, 'w') as out:
+            write_similarity_header(out, expand_similarity)
+            for block in dag_parser.iter_blocks(input_file):
+                average = add_block(stats, block)
+                if average is not None:
+                    write_similarity_block(out, (block["genome_seq"], 
+                                                 block["genome_seq_2"], 
+                                                 block["size"], average), 
+                                           expand_similarity)
+        return stats
+
+    points = dag_parser.split_points(input_file, parse_jobs * 2)
+    lasts = [False] * (len(points) - 2) + [True]
+    with ProcessPoolExecutor(max_workers=parse_jobs) as executor:
+        results = executor.map(stream_range, [input_file] * len(lasts), 
+                               points[:-1], points[1:], lasts)
+
+        stats = new_block_stats()
+        first_row_id = 0
+        with open(output_file, 'w') as out:
+            write_similarity_header(out, expand_similarity)
+            for rows, range_stats, messages, row_count in results:
+                dag_parser.print_messages(messages, first_row_id)
+                first_row_id += row_count
+                for row in rows:
+                    write_similarity_block(out, row, expand_similarity)
+                merge_block_stats(stats, range_stats)
+    return stats
+
+
+def find_cutoffs(blocks_avg_sim, block_simis, output_prefix, 
+                 n_bootstrap = 0, binormal_mode = "grid"):
+    # The cutoffs stage, from the similarities saved by extract_pairs.
+    sample = similarity_sample(blocks_avg_sim)
+    best_cutoff = fit_cutoffs(sample, output_prefix, n_bootstrap, 
+                              binormal_mode)
+    
+    # Stat the pair t1 & t2
+    t1_stat_file = output_prefix + '.similarity.t1'
+    stat_pair_t1(blocks_avg_sim, best_cutoff, t1_stat_file)
+
+    # Calculate another pair t1
+    another_t1_file = output_prefix + '.between.similarity.t1'
+    stat_pair_between_t1(block_simis, best_cutoff, another_t1_file)
+    return best_cutoff
+
+
+def find_stream_cutoffs(stats, output_prefix, 
+                        n_bootstrap = 0, binormal_mode = "grid"):
+    # find_cutoffs from the statistics of stream_pairs, the methods fit
+    # the histogram of the block similarities.
+    count, mean, sd = online_stats.moments(stats["blocks"])
+    print(f"{count} blocks, average similarity {mean:.2f}, sd {sd:.2f}.")
+    best_cutoff = fit_cutoffs(stats["blocks"], output_prefix, n_bootstrap, 
+                              binormal_mode)
+    stat_stream_t1(stats, best_cutoff, 
+                   output_prefix + '.similarity.t1', 
+                   output_prefix + '.between.similarity.t1')
+    return best_cutoff
+
+
+def fit_cutoffs(sample, output_prefix, n_bootstrap = 0, 
+                binormal_mode = "grid"):
+    # sample is a weighted_sample or an online_stats accumulator, turned
+    # into one sample shared by all the methods.
+    sample = weighted_sample.as_sample(sample)
+
+    # Draw distribution plot
+    # plot_file = output_prefix + '.similarity.jpeg'
+    # draw_sim_plot(os.path.basename(output_prefix), sample, plot_file)
+
+    # Outofuse: Fit the distribution with 110 distributions in scipy lib.
+    # fit_file = output_prefix + '.fit.jpeg'
+    # fit_paras_file = output_prefix + '.fit.parameters'
+    # fit_similarity(sample, fit_file, fit_paras_file)
+
+    # Fit the distribution by GMM
+    # fit_gmm_file = output_prefix + '.fit_gmm.jpeg'
+    fit_gmm_file = None
+    fit_gmm_paras_file = output_prefix + '.fit_gmm.parameters'
+    fit_gmm_similarity(sample, fit_gmm_file, fit_gmm_paras_file)
+
+    # Find the cutoff point by GMM
+    gmm_cutoff_paras_files = output_prefix + '.gmm_cutoff.parameters'
+    find_gmm_cutoffs(sample, gmm_cutoff_paras_files, n_bootstrap)
+
+    # Find the cutoff point for two arbitrary normal distributions
+    binormal_cutoff_paras_files = output_prefix + '.binormal_cutoff.parameters'
+    # binormal_cutoff_plot_files = output_prefix + '.binormal_cutoff.jpeg'
+    binormal_cutoff_plot_files = None
+    best_cutoff = find_binormal_cutoffs(sample, 
+                          binormal_cutoff_paras_files, 
+                          binormal_cutoff_plot_files, 
+                          binormal_mode, 
+                          n_bootstrap)
+    return best_cutoff
+
+
+def process_species(species, current_dir, directory, 
+                    n_bootstrap = 0, binormal_mode = "grid", parse_jobs = 1, 
+                    expand_similarity = False, stream_blocks = False):
+    print(f"****** Start dealing with {input_stream.species_name(species)}. ******")
+
+    input_file = os.path.join(current_dir, species)
+    output_prefix = os.path.join(current_dir, directory, 
+                                 input_stream.species_name(species))
+    if stream_blocks:
+        stats = stream_pairs(input_file, output_prefix, expand_similarity, 
+                             parse_jobs)
+        find_stream_cutoffs(stats, output_prefix, n_bootstrap, binormal_mode)
+        return
+
+    blocks_avg_sim, block_simis = extract_pairs(input_file, output_prefix, 
+                                                   parse_jobs, 
+                                                   expand_similarity)
+    find_cutoffs(blocks_avg_sim, block_simis, output_prefix, 
+                 n_bootstrap, binormal_mode)
+
+
 def main(args):
-    species_list = parse_species_list(args)
+    # --jobs N runs N species at once
+    args, jobs = species_pool.parse_jobs(args)
+    species_list = input_stream.parse_species_list(args)
     if species_list is None or len(species_list) <= 0:
         print("No valid input.")
         return
@@ -260,73 +425,27 @@ def main(args):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+    # Bootstrap replicates for the intervals of the cutoffs, 0 to skip.
+    n_bootstrap = 0
+    # "grid" tries 100 evenly spaced cutoffs, 
+    # "unique" tries every unique block similarity.
+    binormal_mode = "grid"
+    # True writes the legacy .similarity, every block row repeated once per
+    # anchor pair, instead of one row per block with its size.
+    expand_similarity = False
+    # True reads one block at a time and keeps only running histograms,
+    # for genomes too large for the table (not cached).
+    stream_blocks = False
+
     # species_list = ['rainbow_trout', 'chum_salmon']
-    for species in species_list:
-        print(f"****** Start dealing with {os.path.basename(species)}. ******")
-
-        input_file = os.path.join(current_dir, species)
-        blocks_avg_sim, each_simi_dict = parse_dagchainer_output(input_file)
-
-        # Print extracted chain information
-        output_file = os.path.join(current_dir, directory, 
-                                   os.path.basename(species) 
-                                   + '.similarity')
-        save_similarity(output_file, blocks_avg_sim)
-
-        # Draw distribution plot
-        # plot_file = os.path.join(current_dir, directory, 
-        #                          os.path.basename(species) 
-        #                          + '.similarity.jpeg')
-        # draw_sim_plot(species, blocks_avg_sim, plot_file)
-
-        # Outofuse: Fit the distribution with 110 distributions in scipy lib.
-        # fit_file = os.path.join(current_dir, directory, 
-        #                          os.path.basename(species) + 
-        #                          '.fit.jpeg')
-        # fit_paras_file = os.path.join(current_dir, directory, 
-        #                          os.path.basename(species) + 
-        #                          '.fit.parameters')
-        # fit_similarity(blocks_avg_sim, fit_file, fit_paras_file)
-
-        # Fit the distribution by GMM
-        # fit_gmm_file = os.path.join(current_dir, directory, 
-        #                          os.path.basename(species) + 
-        #                          '.fit_gmm.jpeg')
-        fit_gmm_file = None
-        fit_gmm_paras_file = os.path.join(current_dir, directory, 
-                                 os.path.basename(species) + 
-                                 '.fit_gmm.parameters')
-        fit_gmm_similarity(blocks_avg_sim, fit_gmm_file, fit_gmm_paras_file)
-
-        # Find the cutoff point by GMM
-        gmm_cutoff_paras_files = os.path.join(current_dir, directory, 
-                                          os.path.basename(species) + 
-                                          '.gmm_cutoff.parameters')
-        find_gmm_cutoffs(blocks_avg_sim, gmm_cutoff_paras_files)
-
-        # Find the cutoff point for two arbitrary normal distributions
-        binormal_cutoff_paras_files = os.path.join(current_dir, directory, 
-                                          os.path.basename(species) + 
-                                          '.binormal_cutoff.parameters')
-        # binormal_cutoff_plot_files = os.path.join(current_dir, directory, 
-        #                                   os.path.basename(species) + 
-        #                                   '.binormal_cutoff.jpeg')
-        binormal_cutoff_plot_files = None
-        best_cutoff = find_binormal_cutoffs(blocks_avg_sim, 
-                              binormal_cutoff_paras_files, 
-                              binormal_cutoff_plot_files)
-        
-        # Stat the pair t1 & t2
-        t1_stat_file = os.path.join(current_dir, directory, 
-                                    os.path.basename(species) + 
-                                    '.similarity.t1')
-        stat_pair_t1(output_file, best_cutoff, t1_stat_file)
-
-        # Calculate another pair t1
-        another_t1_file = os.path.join(current_dir, directory, 
-                                    os.path.basename(species) + 
-                                    '.between.similarity.t1')
-        stat_pair_between_t1(each_simi_dict, best_cutoff, another_t1_file)
+    worker = functools.partial(process_species, current_dir=current_dir, 
+                               directory=directory, n_bootstrap=n_bootstrap, 
+                               binormal_mode=binormal_mode, 
+                               expand_similarity=expand_similarity, 
+                               stream_blocks=stream_blocks, 
+                               parse_jobs=species_pool.jobs_per_species(
+                                   jobs, len(species_list)))
+    species_pool.map_species(worker, species_list, jobs)
 
     print(f"Mission completed. Please check the results in {directory} folder.")
 
@@ -1,13 +1,19 @@
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import stats
+import weighted_sample
+import bootstrap
+
+# scipy and matplotlib are only imported by the functions below that use
+# them, the cutoff search itself needs numpy only.
 
 def calc_mse(data, fit):
+    from scipy import stats
     # 计算评估指标，这里可以使用均方误差、拟合优度或其他适当的指标
     mse = np.mean((data - stats.norm.pdf(data, *fit)) ** 2)
     return mse
 
 def calc_mle(data, mean, sd):
+    from scipy import stats
     mle = np.sum(stats.norm.pdf(data, loc=mean, scale=sd))
     return mle
 
@@ -19,43 +25,140 @@ def simulate_data():
                         np.random.normal(5, 1, 500)])
     return data
 
-def measure_by_mle(data, parameter_file_name, plot_file_name):
-    data = np.array(data).reshape(-1, 1)
+def split_fits(values, counts):
+    # Normal MLE fits (mean, sd) of data < node and data >= node for every
+    # node in the sorted unique values, from cumulative sums and sums of
+    # squares. The values are centred first to keep the variance accurate.
+    shift = np.sum(values * counts) / np.sum(counts)
+    x = values - shift
+    n = np.concatenate(([0], np.cumsum(counts)))[:-1].astype(float)
+    s = np.concatenate(([0.0], np.cumsum(counts * x)))[:-1]
+    q = np.concatenate(([0.0], np.cumsum(counts * x * x)))[:-1]
+    n_all = np.sum(counts)
+    s_all = np.sum(counts * x)
+    q_all = np.sum(counts * x * x)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_before = s / n
+        var_before = q / n - mean_before ** 2
+        mean_after = (s_all - s) / (n_all - n)
+        var_after = (q_all - q) / (n_all - n) - mean_after ** 2
+
+    sd_before = np.sqrt(np.clip(var_before, 0, None))
+    sd_after = np.sqrt(np.clip(var_after, 0, None))
+    return (mean_before + shift, sd_before, mean_after + shift, sd_after)
+
+
+def weighted_pdf_sums(values, counts, means, sds, positions, before, 
+                      chunk_size = 128):
+    # Sum of the normal densities of the data before (or after) each node,
+    # i.e. calc_mle for every node at once. The node at position k (in the
+    # sorted unique values) only needs the values [0, k) (or [k, n)), so
+    # each chunk of sorted nodes only looks at those.
+    n_nodes = len(positions)
+    sums = np.empty(n_nodes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_sds = 1.0 / sds
+    for start in range(0, n_nodes, chunk_size):
+        stop = min(start + chunk_size, n_nodes)
+        first = positions[start]
+        last = positions[stop - 1]
+        lo, hi = (0, last) if before else (first, len(values))
+        inv_sd = inv_sds[start:stop].reshape(-1, 1)
+
+        with np.errstate(invalid='ignore', over='ignore'):
+            density = np.subtract(values[lo:hi], 
+                                  means[start:stop].reshape(-1, 1))
+            density *= inv_sd
+            np.square(density, out=density)
+            density *= -0.5
+            np.exp(density, out=density)
+
+        # Mask the values on the other side of the nodes of this chunk,
+        # which all lie between its first and last node.
+        rows = positions[start:stop].reshape(-1, 1)
+        cols = np.arange(first, last)
+        between = density[:, first - lo:last - lo]
+        if before:
+            between[cols >= rows] = 0.0
+        else:
+            between[cols < rows] = 0.0
+
+        # Nodes without spread give nan here, they are masked by the caller.
+        with np.errstate(invalid='ignore'):
+            sums[start:stop] = (density @ counts[lo:hi]) * inv_sd[:, 0] \
+                / np.sqrt(2 * np.pi)
+    return sums
+
+
+def first_best_node(sample, nodes):
+    # The first of the sorted nodes with the best mle. A side with a single
+    # unique value has no normal fit, as stats.norm.fit gives a zero scale
+    # for it, and an empty side has none either.
+    values, counts = sample
+    mean_before, sd_before, mean_after, sd_after = split_fits(values, counts)
+    positions = np.searchsorted(values, nodes, side='left')
+    valid = (positions >= 2) & (positions <= len(values) - 2)
+    if not np.any(valid):
+        return None
+
+    mle = weighted_pdf_sums(values, counts, mean_before[positions], 
+                            sd_before[positions], positions, True) + \
+        weighted_pdf_sums(values, counts, mean_after[positions], 
+                          sd_after[positions], positions, False)
+    mle[~valid] = -np.inf
+    return nodes[np.argmax(mle)]
+
+
+def search_node(sample, mode = "grid"):
+    """
+    mode "grid" tries 100 evenly spaced nodes between the min and max,
+    mode "unique" tries every unique value of the data as the node.
+    Return the best node, its mle and the normal fits of both sides.
+    """
+    if mode == "unique":
+        nodes = sample.values
+    else:
+        nodes = np.linspace(sample.values[0], sample.values[-1], 100)
+
+    # Score all the nodes at once from the cumulative sums, then fit both
+    # sides of the best one for the report.
+    node = first_best_node(sample, nodes)
+    if node is None:
+        return None, float('-inf'), None, None
+
+    # 分段拟合
+    data_before_node, data_after_node = weighted_sample.split(sample, node)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fit_before_node = weighted_sample.norm_fit(data_before_node)
+        fit_after_node = weighted_sample.norm_fit(data_after_node)
 
-    # 初始化最优结果
-    best_mle_score = float('-inf')
-    best_fit_before_node = None
-    best_fit_after_node = None
-    best_node = None
+        # try MLE
+        mle = weighted_sample.norm_pdf_sum(data_before_node, 
+                                           *fit_before_node) + \
+            weighted_sample.norm_pdf_sum(data_after_node, *fit_after_node)
 
-    # 从左至右循环遍历所有节点位置
-    # for node in np.unique(data):
-    for node in np.linspace(np.min(data), np.max(data), 100):
-        # 分段拟合
-        data_before_node = data[data < node].reshape(-1, 1)
-        data_after_node = data[data >= node].reshape(-1, 1)
+    return node, mle, fit_before_node, fit_after_node
 
-        if len(data_before_node) <= 0:
-            continue
 
-        fit_before_node = stats.norm.fit(data_before_node)
-        fit_after_node = stats.norm.fit(data_after_node)
-        
-        # try MLE
-        mle = calc_mle(data_before_node, fit_before_node[0], 
-                       fit_before_node[1]) + \
-                calc_mle(data_after_node, fit_after_node[0], 
-                         fit_after_node[1])
+def search_cutoff(sample, mode = "grid"):
+    # Only the node, for bootstrap.
+    return search_node(sample, mode)[0]
 
-        # 更新最优结果
-        if mle > best_mle_score:
-            best_mle_score = mle
-            best_fit_before_node = fit_before_node
-            best_fit_after_node = fit_after_node
-            best_node = node
+
+def measure_by_mle(data, parameter_file_name, plot_file_name, mode = "grid", 
+                   n_bootstrap = 0, seed = 0, jobs = None):
+    """
+    The data is handled as unique values weighted by their counts.
+    With n_bootstrap > 0, the percentile interval of the cutoff over that 
+    many bootstrap resamples is written to the parameter file as well.
+    """
+    sample = weighted_sample.as_sample(data)
+    best_node, best_mle_score, best_fit_before_node, best_fit_after_node = \
+        search_node(sample, mode)
 
     if plot_file_name:
-        visual_optimal_cutoff(data, best_node, 
+        visual_optimal_cutoff(sample, best_node, 
                             best_fit_before_node, 
                             best_fit_after_node, 
                             plot_file_name)
@@ -67,10 +170,16 @@ def measure_by_mle(data, parameter_file_name, plot_file_name):
             pf.write(f"Best mle: {best_mle_score}\n")
             pf.write(f"Best Fit Before Node (Normal): {best_fit_before_node}\n")
             pf.write(f"Best Fit After Node (Normal): {best_fit_after_node}")
+            if n_bootstrap > 0:
+                cutoffs = bootstrap.bootstrap(
+                    sample, functools.partial(search_cutoff, mode=mode), 
+                    n_bootstrap, seed, jobs)
+                pf.write(f"\n{bootstrap.format_interval(cutoffs)}")
 
     return best_node
 
 def measure_by_mse(data):
+    from scipy import stats
     # 初始化最优结果
     best_score = float('inf')
     best_fit_before_node = None
@@ -109,24 +218,28 @@ def measure_by_mse(data):
     visual_optimal_cutoff(data, best_node, 
                           best_fit_before_node, best_fit_after_node)
 
-def visual_optimal_cutoff(data, best_node, 
+def visual_optimal_cutoff(sample, best_node, 
                           best_fit_before_node, 
                           best_fit_after_node, 
                           plot_file_name):
     # visualize the optimal simulated result
-    data_before_best_node = data[data < best_node].reshape(-1, 1)
-    data_after_best_node = data[data >= best_node].reshape(-1, 1)
+    import matplotlib.pyplot as plt
+    from scipy import stats
+    sample = weighted_sample.as_sample(sample)
+    data_before_best_node, data_after_best_node = \
+        weighted_sample.split(sample, best_node)
 
     plt.clf()
-    plt.hist(data, bins=30, density=True, alpha=0.6, label="Data")
-    x_before_best_node = np.linspace(np.min(data_before_best_node), 
-                    np.max(data_before_best_node), 100)
+    plt.hist(sample.values, weights=sample.counts, 
+             bins=30, density=True, alpha=0.6, label="Data")
+    x_before_best_node = np.linspace(data_before_best_node.values[0], 
+                    data_before_best_node.values[-1], 100)
     plt.plot(x_before_best_node, 
             stats.norm.pdf(x_before_best_node, *best_fit_before_node), 
             label="Before Node (Normal)")
 
-    x_after_best_node = np.linspace(np.min(data_after_best_node), 
-                    np.max(data_after_best_node), 100)
+    x_after_best_node = np.linspace(data_after_best_node.values[0], 
+                    data_after_best_node.values[-1], 100)
     plt.plot(x_after_best_node, 
             stats.norm.pdf(x_after_best_node, *best_fit_after_node), 
             label="After Node (Normal)")
@@ -0,0 +1,489 @@
+import os
+import re
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import input_stream
+
+
+# Bump it whenever the layout of the table changes, so that cached
+# tables are parsed again.
+TABLE_VERSION = 3
+
+# Percent identities are two-decimal strings in the DAG files. They are
+# kept as fixed-point centi-percents, 80.82 as 8082, which fit in a uint16
+# and compare with the cutoffs as exact integers.
+PID_SCALE = 100
+
+# Columns of the block table, one entry per anchor (i.e. per valid row).
+# "mixed" marks a row whose genome sequences differ from those of its
+# block, which only the triplets take, see drop_mixed_rows.
+ANCHOR_COLUMNS = {
+    "chr1": np.int32, "start1": np.int64, "stop1": np.int64,
+    "strand1": np.int8, "kind1": np.int8, "fid1": np.int64, "pid1": np.uint16,
+    "chr2": np.int32, "start2": np.int64, "stop2": np.int64,
+    "strand2": np.int8, "kind2": np.int8, "fid2": np.int64, "pid2": np.uint16,
+    "mixed": np.bool_,
+}
+
+
+def intern(symbols, symbol_ids, symbol):
+    symbol_id = symbol_ids.get(symbol)
+    if symbol_id is None:
+        symbol_id = len(symbols)
+        symbol_ids[symbol] = symbol_id
+        symbols.append(symbol)
+    return symbol_id
+
+
+def symbol_map(symbols, to_symbols):
+    # The ids in to_symbols of symbols, -1 for those missing there, e.g.
+    # to look the chromosomes of a gff table up in a dag table.
+    to_ids = {}
+    for symbol_id, symbol in enumerate(to_symbols):
+        to_ids[symbol] = symbol_id
+    return np.array([to_ids.get(symbol, -1) for symbol in symbols],
+                    dtype=ANCHOR_COLUMNS["chr1"])
+
+
+def parse_pid(text):
+    # The centi-percents of a percent identity text, str or bytes.
+    return int(round(float(text) * PID_SCALE))
+
+
+def pid_value(pid):
+    # The float of the text the identity was parsed from, 8082 -> 80.82.
+    return pid / PID_SCALE
+
+
+def pid_text(pid):
+    # The identity as the float text the triplets have always been printed
+    # with, e.g. "80.82", but "80.8" for 8080 whatever the input text was.
+    return str(pid_value(pid))
+
+
+def pid_cutoff(cutoff, n_pids = 1):
+    """
+    The largest sum s of n_pids identities (in centi-percents) whose average
+    s / n_pids, as a percent float, is <= cutoff. "average <= cutoff" is
+    then "s <= pid_cutoff(cutoff, n_pids)" in integers, with no round-off
+    at the cutoff.
+    """
+    scale = PID_SCALE * n_pids
+    threshold = math.floor(cutoff * scale)
+    while (threshold + 1) / scale <= cutoff:
+        threshold += 1
+    while threshold / scale > cutoff:
+        threshold -= 1
+    return threshold
+
+
+def is_anchor_row(line):
+    # The structure parse_range accepts an anchor row with.
+    fields = line.strip().split(b'\t')
+    return len(fields) == 12 and not fields[0].startswith(b"#") and \
+        len(fields[3].split(b'||')) == 9 and len(fields[7].split(b'||')) == 9
+
+
+def split_points(file_path, n_chunks):
+    """
+    Byte offsets splitting the file into about n_chunks ranges. Every inner
+    offset is the start of a "#" line right after an anchor row, where the
+    serial parser has just closed a block, so that each range parses the
+    same on its own.
+    """
+    size = os.path.getsize(file_path)
+    points = [0]
+    with open(file_path, 'rb') as file:
+        for k in range(1, n_chunks):
+            target = max(size * k // n_chunks, points[-1])
+            file.seek(target)
+            # skip the partial line, whose previous line is unknown
+            file.readline()
+            previous = file.readline()
+            offset = file.tell()
+            for raw_line in file:
+                if raw_line.lstrip().startswith(b"#") and \
+                        is_anchor_row(previous):
+                    break
+                previous = raw_line
+                offset += len(raw_line)
+            if offset >= size:
+                break
+            if offset > points[-1]:
+                points.append(offset)
+    points.append(size)
+    return points
+
+
+def new_scan(start = 0):
+    # The state scan_blocks shares with its caller: the symbols interned
+    # so far, the invalid lines, and where the scan has got to.
+    return {
+        "chromosomes": [], "chromosome_ids": {}, "kinds": [], "kind_ids": {},
+        "messages": [], "row_id": 0, "offset": start,
+        "last_block_closed": False,
+    }
+
+
+def scan_blocks(file_path, scan, start = 0, stop = None, 
+                debug_rows_count = 0):
+    """
+    The blocks in the byte range [start, stop) of the file, one at a time.
+    A block is yielded as soon as a "#" line closes it, the last one at the
+    end of the range, as a dict of its "header", the "byte_start" offset 
+    its text ("#" lines included) starts at, its "size", whether a "#" line
+    "closed" it and its anchor "columns" as lists. The symbols, messages
+    and final offset go to scan, see new_scan.
+    """
+    chromosomes = scan["chromosomes"]
+    chromosome_ids = scan["chromosome_ids"]
+    kinds = scan["kinds"]
+    kind_ids = scan["kind_ids"]
+    messages = scan["messages"]
+    pending_header = ""
+
+    # global initialization
+    row_id = scan["row_id"]
+    offset = start
+    gap_start = start
+
+    # block initialization
+    current_chr = -1
+    current_chr_2 = -1
+    block = None
+
+    for raw_line in input_stream.read_lines(file_path, start):
+        if stop is not None and offset >= stop:
+            break
+        row_id += 1
+        line_start = offset
+        offset += len(raw_line)
+
+        # For debug
+        if debug_rows_count > 0 and row_id == debug_rows_count:
+            offset = line_start
+            break
+
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        # If starts with "#", the current block (if any) is closed.
+        if line.startswith(b"#"):
+            if block is not None:
+                scan["row_id"] = row_id
+                scan["offset"] = offset
+                scan["last_block_closed"] = True
+                block["closed"] = True
+                yield block
+                block = None
+                current_chr = -1
+                current_chr_2 = -1
+                gap_start = line_start
+                pending_header = ""
+            if not line.startswith(b"#Ks"):
+                pending_header = line.decode()
+            scan["last_block_closed"] = True
+            continue
+
+        # check data validation
+        fields = line.split(b'\t')
+        if len(fields) != 12:
+            messages.append((row_id, f" with {len(fields)} fields."))
+            continue
+
+        # chr1||start1||stop1||name1||strand1||type1||db_feature_id1||genome_order1||percent_id1
+        # chr2||start2||stop2||name2||strand2||type2||db_feature_id2||genome_order2||percent_id2
+        chain_info = fields[3].split(b'||')
+        chain_info_2 = fields[7].split(b'||')
+        if len(chain_info) != 9 or len(chain_info_2) != 9:
+            messages.append((row_id, f" with fault \
+                      columns for the two genome sequence."))
+            continue
+
+        genome_seq = intern(chromosomes, chromosome_ids,
+                            chain_info[0].decode())
+        genome_seq_2 = intern(chromosomes, chromosome_ids,
+                              chain_info_2[0].decode())
+        # The genome sequence within a block should be the same, the
+        # other rows are kept for the triplets but marked.
+        mixed = False
+        if current_chr != -1 and genome_seq != current_chr:
+            messages.append((row_id, f" with \
+                      different genome sequence within current block"))
+            mixed = True
+        elif current_chr_2 != -1 and genome_seq_2 != current_chr_2:
+            messages.append((row_id, f" with \
+                      different genome sequence 2 within current block"))
+            mixed = True
+
+        # new block
+        if block is None:
+            block = {"header": pending_header, "byte_start": gap_start,
+                     "size": 0, "columns": {}}
+            for name in ANCHOR_COLUMNS:
+                block["columns"][name] = []
+            columns = block["columns"]
+            scan["last_block_closed"] = False
+
+        if not mixed:
+            current_chr = genome_seq
+            current_chr_2 = genome_seq_2
+        block["size"] += 1
+
+        columns["chr1"].append(genome_seq)
+        columns["start1"].append(int(chain_info[1]))
+        columns["stop1"].append(int(chain_info[2]))
+        columns["strand1"].append(int(chain_info[4]))
+        columns["kind1"].append(intern(kinds, kind_ids,
+                                       chain_info[5].decode()))
+        columns["fid1"].append(int(chain_info[6]))
+        columns["pid1"].append(parse_pid(chain_info[8]))
+
+        columns["chr2"].append(genome_seq_2)
+        columns["start2"].append(int(chain_info_2[1]))
+        columns["stop2"].append(int(chain_info_2[2]))
+        columns["strand2"].append(int(chain_info_2[4]))
+        columns["kind2"].append(intern(kinds, kind_ids,
+                                       chain_info_2[5].decode()))
+        columns["fid2"].append(int(chain_info_2[6]))
+        columns["pid2"].append(parse_pid(chain_info_2[8]))
+        columns["mixed"].append(mixed)
+
+    scan["row_id"] = row_id
+    scan["offset"] = offset
+    if block is not None:
+        block["closed"] = False
+        yield block
+
+
+def parse_range(file_path, start = 0, stop = None, debug_rows_count = 0):
+    """
+    Parse the lines in the byte range [start, stop) of the file. Return the
+    block table of the range, the (row id, message) of its invalid lines
+    and the number of lines read, row ids being counted from the start.
+    """
+    columns = {}
+    for name in ANCHOR_COLUMNS:
+        columns[name] = []
+    block_offsets = []
+    block_bytes = []
+    headers = []
+    anchor_count = 0
+
+    scan = new_scan(start)
+    for block in scan_blocks(file_path, scan, start, stop, debug_rows_count):
+        block_offsets.append(anchor_count)
+        block_bytes.append(block["byte_start"])
+        headers.append(block["header"])
+        for name in ANCHOR_COLUMNS:
+            columns[name].extend(block["columns"][name])
+        anchor_count += block["size"]
+
+    block_offsets.append(anchor_count)
+    block_bytes.append(scan["offset"])
+
+    table = {
+        "file_path": file_path,
+        "block_offsets": np.array(block_offsets, dtype=np.int64),
+        "block_bytes": np.array(block_bytes, dtype=np.int64),
+        "headers": headers,
+        "last_block_closed": scan["last_block_closed"],
+        "chromosomes": scan["chromosomes"],
+        "kinds": scan["kinds"],
+    }
+    for name, dtype in ANCHOR_COLUMNS.items():
+        table[name] = np.array(columns[name], dtype=dtype)
+    return table, scan["messages"], scan["row_id"]
+
+
+def header_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_header(header):
+    """
+    The metadata of a block header such as
+    "#1\t444.0\ta64186_NC_050106.1\tb64186_NC_050116.1\tf\t9  Mean Ks:  2.3766\tMean Kn: 0.2284",
+    i.e. its "block_id", block "score", "name1" and "name2", "orientation"
+    (f or r), "block_size" and "mean_ks" and "mean_kn". The texts are kept
+    as they are, the numbers are floats, None when missing.
+    """
+    fields = header.strip().strip('#').split('\t') if header else []
+    meta = {}
+    for i, name in enumerate(["block_id", "score", "name1", "name2",
+                              "orientation", "block_size"]):
+        meta[name] = fields[i] if i < len(fields) else None
+    if meta["score"] is not None:
+        meta["score"] = header_number(meta["score"])
+    if meta["block_size"] is not None:
+        meta["block_size"] = meta["block_size"].split(" ")[0]
+    for name, label in [("mean_ks", "Mean Ks:"), ("mean_kn", "Mean Kn:")]:
+        found = re.search(re.escape(label) + r"\s*(\S+)", header or "")
+        meta[name] = header_number(found.group(1)) if found else None
+    return meta
+
+
+def iter_blocks(file_path, debug_rows_count = 0, start = 0, stop = None, 
+                scan = None):
+    """
+    The blocks of a DAGChainer file one at a time, as parse_dag reads them,
+    holding only the current block in memory, for files too large for a
+    table. A block is a dict of its "header" text and metadata (see
+    parse_header), "genome_seq" and "genome_seq_2", its "size", whether a
+    "#" line "closed" it (parse_dag leaves out a last block which is not)
+    and its anchors as the arrays of ANCHOR_COLUMNS, without the mixed
+    rows as drop_mixed_rows leaves them out, the chromosomes and kinds as
+    the names of "chromosomes" and "kinds". The invalid lines are
+    printed on the way, unless a scan (see new_scan) of the byte range
+    [start, stop) is given to collect them, as for parse_range.
+    """
+    printing = scan is None
+    if printing:
+        scan = new_scan(start)
+    for block in scan_blocks(file_path, scan, start, stop, debug_rows_count):
+        if printing:
+            print_messages(scan["messages"])
+            del scan["messages"][:]
+
+        anchors = {}
+        keep = ~np.array(block["columns"]["mixed"], dtype=np.bool_)
+        for name, dtype in ANCHOR_COLUMNS.items():
+            anchors[name] = np.array(block["columns"][name], dtype=dtype)[keep]
+        anchors["header"] = block["header"]
+        anchors.update(parse_header(block["header"]))
+        anchors["genome_seq"] = scan["chromosomes"][anchors["chr1"][0]]
+        anchors["genome_seq_2"] = scan["chromosomes"][anchors["chr2"][0]]
+        anchors["size"] = len(anchors["chr1"])
+        anchors["closed"] = block["closed"]
+        anchors["chromosomes"] = scan["chromosomes"]
+        anchors["kinds"] = scan["kinds"]
+        yield anchors
+    if printing:
+        print_messages(scan["messages"])
+
+
+def print_messages(messages, first_row_id = 0):
+    for row_id, message in messages:
+        print(f"Invalid line {first_row_id + row_id}{message}")
+
+
+def merge_tables(chunks):
+    # One table out of the tables of consecutive ranges, with the symbols
+    # interned again in their order of first appearance. The last block of
+    # a range ends where the first block of the next one starts.
+    chromosomes = []
+    chromosome_ids = {}
+    kinds = []
+    kind_ids = {}
+    block_offsets = []
+    block_bytes = []
+    headers = []
+    columns = {}
+    for name in ANCHOR_COLUMNS:
+        columns[name] = []
+
+    anchor_count = 0
+    for chunk in chunks:
+        chromosome_map = np.array([intern(chromosomes, chromosome_ids, symbol)
+                                   for symbol in chunk["chromosomes"]],
+                                  dtype=ANCHOR_COLUMNS["chr1"])
+        kind_map = np.array([intern(kinds, kind_ids, symbol)
+                             for symbol in chunk["kinds"]],
+                            dtype=ANCHOR_COLUMNS["kind1"])
+        for name in ANCHOR_COLUMNS:
+            column = chunk[name]
+            if name in ["chr1", "chr2"]:
+                column = chromosome_map[column]
+            elif name in ["kind1", "kind2"]:
+                column = kind_map[column]
+            columns[name].append(column)
+
+        block_offsets.append(chunk["block_offsets"][:-1] + anchor_count)
+        block_bytes.append(chunk["block_bytes"][:-1])
+        headers += chunk["headers"]
+        anchor_count += int(chunk["block_offsets"][-1])
+    block_offsets.append(np.array([anchor_count]))
+    block_bytes.append(chunks[-1]["block_bytes"][-1:])
+
+    table = {
+        "file_path": chunks[0]["file_path"],
+        "block_offsets": np.concatenate(block_offsets).astype(np.int64),
+        "block_bytes": np.concatenate(block_bytes).astype(np.int64),
+        "headers": headers,
+        "last_block_closed": chunks[-1]["last_block_closed"],
+        "chromosomes": chromosomes,
+        "kinds": kinds,
+    }
+    for name, dtype in ANCHOR_COLUMNS.items():
+        table[name] = np.concatenate(columns[name]).astype(dtype)
+    return table
+
+
+def parse_dag(file_path, debug_rows_count = 0, jobs = 1, n_chunks = None):
+    """
+    Read a DAGChainer file once and return its columnar block table.
+
+    A block is a run of anchor rows between two "#" lines. The anchors of
+    block i are the rows block_offsets[i]:block_offsets[i+1] of the anchor
+    columns, its header is the last "#" line before it which is not the
+    "#Ks" column line, and its raw text (headers included) is the byte
+    range block_bytes[i]:block_bytes[i+1] of the file.
+
+    With jobs > 1 the file is split at block boundaries into n_chunks
+    (by default twice jobs) ranges, parsed in that many worker processes
+    and merged in order, which gives the same table. Compressed files and
+    tar members are streamed and parsed in one process.
+    """
+    if jobs <= 1 or debug_rows_count > 0 or \
+            not input_stream.is_plain(file_path):
+        table, messages, _ = parse_range(file_path, 0, None, debug_rows_count)
+        print_messages(messages)
+        return table
+
+    points = split_points(file_path, n_chunks or jobs * 2)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(parse_range, [file_path] * (len(points) - 1),
+                                    points[:-1], points[1:]))
+
+    first_row_id = 0
+    for _, messages, row_count in results:
+        print_messages(messages, first_row_id)
+        first_row_id += row_count
+    return merge_tables([chunk for chunk, _, _ in results])
+
+
+def block_count(table):
+    return len(table["block_offsets"]) - 1
+
+
+def closed_block_count(table):
+    # The stages used to record a block only when the next "#" line
+    # closed it, thus a block at the very end of the file is left out.
+    n_blocks = block_count(table)
+    if n_blocks > 0 and not table["last_block_closed"]:
+        return n_blocks - 1
+    return n_blocks
+
+
+def drop_mixed_rows(table):
+    """
+    The table without its "mixed" rows, those whose genome sequences
+    differ from the ones of their block. The stages but the triplets have
+    always left them out. The table itself, not a copy, when it has none.
+    """
+    mixed = table["mixed"]
+    if not np.any(mixed):
+        return table
+    keep = ~mixed
+    kept = dict(table)
+    for name in ANCHOR_COLUMNS:
+        kept[name] = table[name][keep]
+    # The first row of a block is never mixed, no block gets empty.
+    kept["block_offsets"] = np.concatenate(
+        ([0], np.cumsum(keep)))[table["block_offsets"]].astype(np.int64)
+    return kept
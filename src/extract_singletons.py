@@ -1,306 +1,284 @@
 import sys
 import os
-import calculate_simi
-
-def parse_and_extract(file_path, out_file_path):
-    with open(file_path, 'r') as file, \
-        open(out_file_path, 'w') as fout:
-        # global initialization
-        row_id = 0
-        genome_default = "CURR"
-        genome_default_2 = "CURR_2"
-
-        # block initialization
-        current_genome_seq = genome_default
-        current_genome_seq_2 = genome_default_2
-        block_count = 0
-
+import functools
+import numpy as np
+import dag_parser
+import table_cache
+import species_pool
+import input_stream
+
+def save_dag(table, out_file_path):
+    chromosomes = table["chromosomes"]
+    kinds = table["kinds"]
+    headers = table["headers"]
+    offsets = table["block_offsets"]
+    # The identities are written back as the percents of the input, e.g.
+    # 80.82 for 8082 and 100.0 for 10000, not as the integers of the table.
+    columns = [table[name].tolist() for name in 
+               ["chr1", "start1", "stop1", "strand1", "kind1", "fid1", "pid1",
+                "chr2", "start2", "stop2", "strand2", "kind2", "fid2", "pid2"]]
+    for k in [6, 13]:
+        columns[k] = [dag_parser.pid_text(pid) for pid in columns[k]]
+
+    with open(out_file_path, 'w') as fout:
         fout.write(f"# genome_seq\tstart_1\tend_1\ttype_1\tkind_1\tfid_1\tpid_1\tgenome_seq_2\tstart_2\tend_2\ttype_2\tkind_2\tfid_2\tpid_2\n")
 
-        for line in file:
-            row_id += 1
-            line = line.strip()
-            
-            if not line:
-                continue
-
-            # If starts with "#", new block starts.
-            # Thus calculate the average of last block.
-            if line.startswith("#"):
-                # Record the second line
-                if row_id == 2:
-                    fout.write(f"{line}\t{-1}\n")
-                
-                if block_count <= 0:
-                    # print(f"Skip line {row_id} which should be the starting.")
-                    continue
-                
-                # record block start line and last block's size for checking
-                fout.write(f"{line}\t{block_count}\n")
-                    
-                # re-init
-                current_genome_seq = genome_default
-                current_genome_seq_2 = genome_default_2
-                block_count = 0
-
-            # check data validation
-            fields = line.split('\t')
-            if len(fields) != 12:
-                if not line.startswith("#"):
-                    print(f"Invalid line {row_id} with {len(fields)} fields.")
-                continue
-
-            # chr1||start1||stop1||name1||strand1||type1||db_feature_id1||genome_order1||percent_id1
-            # chr2||start2||stop2||name2||strand2||type2||db_feature_id2||genome_order2||percent_id2
-            chain_info = fields[3].split('||')
-            chain_info_2 = fields[7].split('||')
-            if len(chain_info) != 9 or len(chain_info_2) != 9:
-                print(f"Invalid line {row_id} with fault \
-                      columns for the two genome sequence.")
-                continue
-            # Since the file records paralog, chr1 should be equal to chr2.
-            # if chain_info[0] != chain_info_2[0]:
-            #     print(f"Invalid line {row_id} with different genome comparison.")
-            #     continue
-            
-            genome_seq = chain_info[0]
-            genome_seq_2 = chain_info_2[0]
-            # The genome sequence within a block should be the same.
-            if current_genome_seq != genome_default \
-                and genome_seq != current_genome_seq:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence within current block")
-                continue
-            if current_genome_seq_2 != genome_default_2 \
-                and genome_seq_2 != current_genome_seq_2:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence 2 within current block")
-                continue
-
-            current_genome_seq = genome_seq
-            start_1 = chain_info[1]
-            end_1 = chain_info[2]
-            type_1 = chain_info[4]
-            kind_1 = chain_info[5]
-            fid_1 = chain_info[6]
-            pid_1 = chain_info[8]
-
-            current_genome_seq_2 = genome_seq_2
-            start_2 = chain_info_2[1]
-            end_2 = chain_info_2[2]
-            type_2 = chain_info_2[4]
-            kind_2 = chain_info_2[5]
-            fid_2 = chain_info_2[6]
-            pid_2 = chain_info_2[8]
-
-            block_count += 1
-
-            fout.write(f"{current_genome_seq}\t{start_1}\t{end_1}\t{type_1}\t{kind_1}\t{fid_1}\t{pid_1}\t{current_genome_seq_2}\t{start_2}\t{end_2}\t{type_2}\t{kind_2}\t{fid_2}\t{pid_2}\n")
-
-
-def parse_gff(file_path, out_file_path, seqtypes = ["gene", "CDS"]):
-    with open(file_path, 'r') as file, \
-        open(out_file_path, 'w') as fout:
-        row_id = 0
-
+        last_block_count = -1
+        for i in range(len(headers)):
+            # record block start line and last block's size for checking
+            if headers[i]:
+                fout.write(f"{headers[i]}\t{last_block_count}\n")
+            last_block_count = int(offsets[i + 1] - offsets[i])
+
+            for row in zip(*[column[offsets[i]:offsets[i + 1]] for column in columns]):
+                (chr_1, start_1, end_1, type_1, kind_1, fid_1, pid_1, 
+                 chr_2, start_2, end_2, type_2, kind_2, fid_2, pid_2) = row
+                fout.write(f"{chromosomes[chr_1]}\t{start_1}\t{end_1}\t{type_1}\t{kinds[kind_1]}\t{fid_1}\t{pid_1}\t{chromosomes[chr_2]}\t{start_2}\t{end_2}\t{type_2}\t{kinds[kind_2]}\t{fid_2}\t{pid_2}\n")
+
+
+def gff_features(gff_table, seqtypes = ["gene", "CDS"], symbols = None):
+    """
+    The features of the seqtypes in file order, as the arrays "chr", 
+    "start", "end" and "fid" and their normalized gff "lines". chr is the 
+    id of the chromosome in symbols, the chromosomes of the dag table, -1 
+    if it is not there. fid is -1 for the features without a coge_fid.
+    """
+    chromosomes = gff_table["chromosomes"]
+    if symbols is None:
+        symbols = chromosomes
+    chromosome_ids = dag_parser.symbol_map(chromosomes, symbols)
+    type_names = gff_table["seqtypes"]
+    wanted = [type_names.index(seq_type) for seq_type in seqtypes 
+              if seq_type in type_names]
+    rows = np.flatnonzero(np.isin(gff_table["seqtype"], wanted))
+
+    lines = []
+    for genome_name, seq_type, start, end, reverse, fid in zip(
+            gff_table["chr"][rows].tolist(), 
+            gff_table["seqtype"][rows].tolist(),
+            gff_table["start"][rows].tolist(), 
+            gff_table["end"][rows].tolist(),
+            gff_table["reverse"][rows].tolist(), 
+            gff_table["fid"][rows].tolist()):
+        # features without coge_fid
+        fid_text = "" if fid < 0 else str(fid)
+        lines.append(f"{chromosomes[genome_name]}\t{type_names[seq_type]}\t{start}\t{end}\t{reverse}\t{fid_text}")
+
+    return {
+        "chr": chromosome_ids[gff_table["chr"][rows]],
+        "start": gff_table["start"][rows],
+        "end": gff_table["end"][rows],
+        "fid": gff_table["fid"][rows],
+        "lines": lines,
+    }
+
+
+def write_lines(fout, lines, rows = None):
+    # The lines (all of them, or the rows of them) in one write.
+    if rows is not None:
+        lines = [lines[i] for i in rows.tolist()]
+    if len(lines) > 0:
+        fout.write("\n".join(lines) + "\n")
+
+
+def save_gff(features, out_file_path):
+    with open(out_file_path, 'w') as fout:
         # head of the file
         fout.write(f"# genome_name\tseq_type\tstart\tend\treverse\tfid\n")
 
-        for line in file:
-            row_id += 1
-            line = line.strip()
-            
-            if not line:
-                continue
-
-            # Ignore lines that start with "#"
-            if line.startswith("#"):
-                continue
-
-            # "genome_name\tseq_type\tstart\tend\treverse\tfid\n"
-            fields = line.split("\t")
-            genome_name = fields[0]
-            seq_type = fields[2]
-
-            # chromosome has no meaning here.
-            # if seq_type in ["chromosome", "contig"]:
-            #     continue
-            if seq_type not in seqtypes:
-                continue
-
-            start = fields[3]
-            end = fields[4]
-            reverse = 1 if fields[6] == "+" else -1
-
-            subfields = fields[-1].split(";")
-            fid = "";
-            for i in range(len(subfields) - 1, 0, -1):
-                if "coge_fid=" in subfields[i]:
-                    fid = subfields[i].split("=")[-1]
-                    break
-            
-            fout.write(f"{genome_name}\t{seq_type}\t{start}\t{end}\t{reverse}\t{fid}\n")
-
-
-def extract(dag_file, gff_file, inpair_gff_out, notinpair_gff_out, extract_first = True):
-    with open(dag_file, 'r') as df, \
-            open(gff_file, 'r') as gf, \
-            open(inpair_gff_out, 'w') as inout, \
+        # "genome_name\tseq_type\tstart\tend\treverse\tfid\n"
+        write_lines(fout, features["lines"])
+
+
+def anchor_blockids(table):
+    # The blockid of every anchor, as in anchor_dict.
+    headers = table["headers"]
+    sizes = np.diff(table["block_offsets"])
+    blockids = 1 + np.cumsum([1 if header else 0 for header in headers])
+    return np.repeat(blockids, sizes)
+
+
+def anchor_dict(table, extract_first = True, key = "fid"):
+    """
+    {genome_seq: {key: [start, end, pid, blockid]}} of the anchors on one
+    half of the dag table, the first anchor of each key wins. genome_seq
+    is the chromosome id of the table and the "fid" key the int fid. The
+    pid is in centi-percents, the "pid" key its text, which no int fid
+    ever equals. The blockid counts the "#" lines of the saved .dag file,
+    its column line included.
+    """
+    suffix = "1" if extract_first else "2"
+    blockids = anchor_blockids(table).tolist()
+
+    dag_dict = {}
+    for genome_seq, start, end, fid, pid, blockid in zip(
+            table[f"chr{suffix}"].tolist(), 
+            table[f"start{suffix}"].tolist(),
+            table[f"stop{suffix}"].tolist(), 
+            table[f"fid{suffix}"].tolist(),
+            table[f"pid{suffix}"].tolist(), blockids):
+        if genome_seq not in dag_dict:
+            dag_dict[genome_seq] = {}
+        thekey = fid if key == "fid" else dag_parser.pid_text(pid)
+        if thekey in dag_dict[genome_seq]:
+            continue
+        dag_dict[genome_seq][thekey] = [start, end, pid, blockid]
+    return dag_dict
+
+
+def feature_anchors(table, features, extract_first = True):
+    """
+    The mask of the features which are on a chromosome with anchors on 
+    that half of the dag table, and the anchor of every feature, i.e. the
+    row of the first anchor with its (chromosome, fid), -1 for none.
+    """
+    suffix = "1" if extract_first else "2"
+    anchor_chrs = table[f"chr{suffix}"]
+    anchor_fids = table[f"fid{suffix}"]
+
+    # (chromosome, fid) as one int64, the fids ranked among all of them
+    fids, ranks = np.unique(np.concatenate((anchor_fids, features["fid"])), 
+                            return_inverse=True)
+    keys = np.concatenate((anchor_chrs, features["chr"])).astype(np.int64) \
+        * len(fids) + ranks.ravel()
+    anchor_keys = keys[:len(anchor_fids)]
+    feature_keys = keys[len(anchor_fids):]
+
+    on_chromosome = np.isin(features["chr"], anchor_chrs)
+    anchors = np.full(len(feature_keys), -1, dtype=np.int64)
+    if len(anchor_keys) > 0:
+        # np.unique gives the first row of every key
+        unique_keys, first_rows = np.unique(anchor_keys, return_index=True)
+        positions = np.minimum(np.searchsorted(unique_keys, feature_keys), 
+                               len(unique_keys) - 1)
+        found = on_chromosome & (unique_keys[positions] == feature_keys)
+        anchors[found] = first_rows[positions[found]]
+    return on_chromosome, anchors
+
+
+def extract(features, on_chromosome, anchors, inpair_gff_out, 
+            notinpair_gff_out):
+    # features without coge_fid have never been extracted, neither those 
+    # on a chromosome without anchors.
+    valid = on_chromosome & (features["fid"] >= 0)
+    paired = anchors >= 0
+
+    with open(inpair_gff_out, 'w') as inout, \
             open(notinpair_gff_out, 'w') as nout:
-        
-        # Preparing dag dict.
-        dag_dict = {}
-        row_id = 0
-        for line in df:
-            row_id += 1
-            line = line.strip()
-            
-            if not line or line.startswith("#"):
-                continue
-
-            fields = line.split("\t")
-            if len(fields) != 14:
-                # print(f"DAG, Skip line {row_id} which doesn't contain 14 fields.")
-                continue
-
-            if extract_first:
-                # sequence 1
-                genome_seq = fields[0]
-                if genome_seq not in dag_dict:
-                    dag_dict[genome_seq] = {}
-                fid = fields[5]
-                if fid in dag_dict[genome_seq]:
-                    # print(f"DAG, Skip line {row_id} which duplicated fid {fid}.")
-                    continue
-                start = int(fields[1])
-                end = int(fields[2])
-                pid = float(fields[6])
-                dag_dict[genome_seq][fid] = [start, end, pid]
-            else:
-                # sequence 2
-                genome_seq = fields[7]
-                if genome_seq not in dag_dict:
-                    dag_dict[genome_seq] = {}
-                fid = fields[12]
-                if fid in dag_dict[genome_seq]:
-                    # print(f"DAG, Skip line {row_id} which duplicated fid {fid} on the second genome sequence.")
-                    continue
-                start = int(fields[8])
-                end = int(fields[9])
-                pid = float(fields[13])
-                dag_dict[genome_seq][fid] = [start, end, pid]
-
-        # for seq in dag_dict:
-        #     print(f"{seq}\n{dag_dict[seq]}\n")
-
         # Start extracting
-        row_id = 0
         inout.write(f"# genome_name\tseq_type\tstart\tend\treverse\tfid\n")
         nout.write(f"# genome_name\tseq_type\tstart\tend\treverse\tfid\n")
-        for line in gf:
-            row_id += 1
-            line = line.strip()
-            
-            if not line or line.startswith("#"):
-                continue
-
-            fields = line.split("\t")
-            if len(fields) != 6:
-                # print(f"GFF file, skip line {row_id} which doesn't contain 6 fields.")
-                continue
-            
-            # genome_name   seq_type        start   end     reverse fid
-            genome_name = fields[0]
-            if genome_name not in dag_dict:
-                # print(f"GFF file, skip line {row_id} whose genome_name is not in dag dict.")
-                continue
-            fid_dict = dag_dict[genome_name]
-            fid = fields[5]
-            # inside a pair
-            if fid in fid_dict:
-                inout.write(f"{line}\n")
-            else:
-                nout.write(f"{line}\n")
-
-
-def stat_singleton(dag_file, gff_file, notinpair_gff_out, extract_first = True):
-    with open(dag_file, 'r') as df, \
-            open(gff_file, 'r') as gf, \
-            open(notinpair_gff_out, 'w') as nout:
-        
-        # Preparing dag dict.
-        dag_dict = {}
-        row_id = 0
-        blockid = 0
-        for line in df:
-            row_id += 1
-            line = line.strip()
-            
-            if not line:
-                continue
-            if line.startswith("#"):
-                blockid += 1
-                continue
-
-            fields = line.split("\t")
-            if len(fields) != 14:
-                # print(f"Skip line {row_id} which doesn't contain 14 fields.")
-                continue
-
-            if extract_first:
-                # sequence 1
-                genome_seq = fields[0]
-                if genome_seq not in dag_dict:
-                    dag_dict[genome_seq] = {}
-                fid = fields[5]
-                if fid in dag_dict[genome_seq]:
-                    # print(f"Skip line {row_id} which duplicated fid {fid}.")
-                    continue
-                start = int(fields[1])
-                end = int(fields[2])
-                pid = float(fields[6])
-                dag_dict[genome_seq][fid] = [start, end, pid, blockid]
-            else:
-                # sequence 2
-                genome_seq = fields[7]
-                if genome_seq not in dag_dict:
-                    dag_dict[genome_seq] = {}
-                fid = fields[13]
-                if fid in dag_dict[genome_seq]:
-                    # print(f"Skip line {row_id} which duplicated fid {fid} on the second genome sequence.")
-                    continue
-                start = int(fields[8])
-                end = int(fields[9])
-                pid = float(fields[13])
-                dag_dict[genome_seq][fid] = [start, end, pid]
-
+        # inside a pair
+        write_lines(inout, features["lines"], np.flatnonzero(valid & paired))
+        write_lines(nout, features["lines"], np.flatnonzero(valid & ~paired))
+
+
+def flanking_anchors(chrs, starts, ends, is_anchor):
+    """
+    The left and right flanking anchors of every feature, as indexes into
+    the features, -1 for none. The features of each chromosome are swept
+    in the order of (start, end), an anchor before the other features at
+    the same place. The left flank of a feature is the last anchor before
+    it, the right flank the first anchor after it, on its chromosome. 
+    Overlapping and nested features thus get the same flanks whatever 
+    their order in the gff file.
+    """
+    n = len(chrs)
+    order = np.lexsort((~is_anchor, ends, starts, chrs))
+    sorted_chrs = chrs[order]
+    positions = np.arange(n)
+    anchor_positions = np.where(is_anchor[order], positions, -1)
+
+    # the last anchor up to each position and the first one from it on
+    left = np.maximum.accumulate(anchor_positions) if n > 0 \
+        else anchor_positions
+    right = np.where(is_anchor[order], positions, n)
+    right = np.minimum.accumulate(right[::-1])[::-1] if n > 0 else right
+
+    lefts = np.full(n, -1, dtype=np.int64)
+    rights = np.full(n, -1, dtype=np.int64)
+    for flanks, sorted_flanks in [(lefts, left), (rights, right)]:
+        inside = (sorted_flanks >= 0) & (sorted_flanks < n)
+        inside[inside] = sorted_chrs[sorted_flanks[inside]] == \
+            sorted_chrs[inside]
+        flanks[order[inside]] = order[sorted_flanks[inside]]
+    return lefts, rights
+
+
+def singleton_rows(table, features, on_chromosome, anchors, 
+                   extract_first = True):
+    """
+    Every feature which is no anchor (a singleton) with its left and right
+    flanking anchors, their fid, pid and blockid, "None" for a missing 
+    one, as the rows of calculate_t in file order.
+    """
+    suffix = "1" if extract_first else "2"
+    valid = on_chromosome & (features["fid"] >= 0)
+    features_index = np.flatnonzero(valid)
+    is_anchor = anchors[features_index] >= 0
+    lefts, rights = flanking_anchors(features["chr"][features_index], 
+                                     features["start"][features_index], 
+                                     features["end"][features_index], 
+                                     is_anchor)
+
+    # "fid\tpid\tblockid" of every anchor, and "None" for no anchor as
+    # the last one, which the flank -1 picks.
+    anchor_index = np.flatnonzero(is_anchor)
+    anchor_rows = anchors[features_index[anchor_index]]
+    flank_texts = [f"{fid}\t{dag_parser.pid_text(pid)}\t{blockid}" 
+                   for fid, pid, blockid in zip(
+                       features["fid"][features_index[anchor_index]].tolist(),
+                       table[f"pid{suffix}"][anchor_rows].tolist(),
+                       anchor_blockids(table)[anchor_rows].tolist())]
+    flank_texts.append("None\tNone\tNone")
+    flank_ids = np.full(len(features_index), -1, dtype=np.int64)
+    flank_ids[anchor_index] = np.arange(len(anchor_index))
+
+    lines = features["lines"]
+    singletons = np.flatnonzero(~is_anchor)
+    return [f"{lines[i]}\t{flank_texts[left]}\t{flank_texts[right]}"
+            for i, left, right in zip(
+                features_index[singletons].tolist(),
+                np.where(lefts[singletons] >= 0, 
+                         flank_ids[lefts[singletons]], -1).tolist(),
+                np.where(rights[singletons] >= 0, 
+                         flank_ids[rights[singletons]], -1).tolist())]
+
+
+def stat_singleton(table, features, on_chromosome, anchors, 
+                   notinpair_gff_out, extract_first = True):
+    # Write the singleton_rows to notinpair_gff_out and return them.
+    rows = singleton_rows(table, features, on_chromosome, anchors, 
+                          extract_first)
+    with open(notinpair_gff_out, 'w') as nout:
+        write_lines(nout, rows)
+    return rows
+
+
+def stat_singleton_batches(dag_dict, features, notinpair_gff_out):
+    # The former statistic, which took the flanks from the batches of 
+    # singletons in file order. Return the rows written to 
+    # notinpair_gff_out, for calculate_t.
+    rows = []
+    with open(notinpair_gff_out, 'w') as nout:
         # Start extracting
         last_paired_fid_dict = {}
         thefid = "LAST"
         lastfid = "LAST"
         last_batch = []
         current_batch = []
-        row_id = 0
         
-        for line in gf:
-            row_id += 1
-            line = line.strip()
-            
-            if not line or line.startswith("#"):
-                continue
-
-            fields = line.split("\t")
-            if len(fields) != 6:
-                # print(f"GFF file, skip line {row_id} which doesn't contain 6 fields.")
+        for genome_name, fid, line in zip(features["chr"].tolist(), 
+                                          features["fid"].tolist(), 
+                                          features["lines"]):
+            if fid < 0:
                 continue
             
             # genome_name   seq_type        start   end     reverse fid
-            genome_name = fields[0]
             if genome_name not in dag_dict:
                 # print(f"GFF file, skip line {row_id} whose genome_name is not in dag dict.")
                 continue
             fid_dict = dag_dict[genome_name]
-            fid = fields[5]
             
             # inside a pair
             if fid in fid_dict:
@@ -310,7 +288,7 @@ def stat_singleton(dag_file, gff_file, notinpair_gff_out, extract_first = True):
             else:
                 if genome_name in last_paired_fid_dict:
                     thefid = last_paired_fid_dict[genome_name]
-                    pid = dag_dict[genome_name][thefid][2]
+                    pid = dag_parser.pid_text(dag_dict[genome_name][thefid][2])
                     blockid = dag_dict[genome_name][thefid][3]
                 else:
                     pid = "None"
@@ -323,11 +301,12 @@ def stat_singleton(dag_file, gff_file, notinpair_gff_out, extract_first = True):
                     lastpid = "None"
                     lastblockid = "None"
                     if lastfid in dag_dict[genome_name]:
-                        lastpid = dag_dict[genome_name][lastfid][2]
+                        lastpid = dag_parser.pid_text(
+                            dag_dict[genome_name][lastfid][2])
                         lastblockid = dag_dict[genome_name][lastfid][3]
                     
                     for theline in last_batch:
-                        nout.write(f"{theline}\t{lastfid}\t{lastpid}\t{lastblockid}\n")
+                        rows.append(f"{theline}\t{lastfid}\t{lastpid}\t{lastblockid}")
                     last_batch = current_batch
                     current_batch = []
                     lastfid = thefid
@@ -336,53 +315,54 @@ def stat_singleton(dag_file, gff_file, notinpair_gff_out, extract_first = True):
         
         # clear the last batch
         for theline in current_batch:
-            nout.write(f"{theline}\tNone\tNone\tNone\n")
+            rows.append(f"{theline}\tNone\tNone\tNone")
+
+        for row in rows:
+            nout.write(f"{row}\n")
+    return rows
 
 
-def calculate_t(notinpair_gff_out, singleton_stat_file, singletons_between_file, cutoff):
+def singleton_pid_sum(fields):
+    """
+    The sum of the identities, in centi-percents, of the two flanking
+    anchors of a singleton row of stat_singleton, split into its fields.
+    None for a singleton between blocks, i.e. when the two anchors are not
+    of the same block or one of them is missing.
+    """
+    blockid1 = fields[8]
+    blockid2 = fields[11]
+    if blockid1 == "None" or blockid2 == "None" or blockid1 != blockid2:
+        return None
+
+    pid1 = fields[7]
+    pid2 = fields[10]
+    return dag_parser.parse_pid(pid1) + dag_parser.parse_pid(pid2)
+
+
+def calculate_t(rows, singleton_stat_file, singletons_between_file, cutoff):
     # not_same_block_count = 0
     singleton_between_count = 0
     t1_count = 0
     t2_count = 0
+    # the average of the two identities against the cutoff, in integers
+    pid_sum_cutoff = dag_parser.pid_cutoff(cutoff, 2)
 
-    with open(notinpair_gff_out, 'r') as fin, \
-        open(singleton_stat_file, 'w') as fout, \
+    with open(singleton_stat_file, 'w') as fout, \
         open(singletons_between_file, 'w') as fout2: 
-        row_id = 0
-        for line in fin:
-            row_id += 1
-            line = line.strip()
-            
-            if not line:
-                continue
-
+        for line in rows:
             fields = line.split("\t")
             if len(fields) != 12:
                 # print(f"In notinpair_gff_out, skip line {row_id} which doesn't contain 12 fields: {line}")
                 continue
 
             # Filter singleton between blocks
-            blockid1 = fields[8]
-            blockid2 = fields[11]
-            # if blockid1 != "None" and blockid2 != "None" and blockid1 != blockid2:
-                # not_same_block_count += 1
-            if blockid1 == "None" or blockid2 == "None" or blockid1 != blockid2:
+            pid_sum = singleton_pid_sum(fields)
+            if pid_sum is None:
                 singleton_between_count += 1
                 fout2.write(f"{line}\n")
                 continue
 
-            pid1 = fields[7]
-            pid2 = fields[10]
-            # if pid1 == "None":
-            #     pid1 = pid2
-            # if pid2 == "None":
-            #     pid2 = pid1
-                
-            pid1 = float(pid1)
-            pid2 = float(pid2)
-
-            avg_pid = (pid1 + pid2) / 2.0
-            if avg_pid <= cutoff:
+            if pid_sum <= pid_sum_cutoff:
                 t1_count += 1
             else:
                 t2_count += 1
@@ -403,72 +383,119 @@ def parse_cutoff(cutoff_para_file):
 
 
 
-def executes(files, extract_first = True, seqtypes = ["gene", "CDS"]):
-    # parse dag file
-    dag_input_file = files[0]
-    dag_output_file = files[1]
-    parse_and_extract(dag_input_file, dag_output_file)
-
-    # parse gff file
-    gff_input_file = files[2]
-    gff_output_file = files[3]
-    parse_gff(gff_input_file, gff_output_file, seqtypes)
+def executes(table, extract_first, features, files, cutoff, 
+             stat_dag_dict = None):
+    # stat_dag_dict runs the former batch statistic on it instead.
+    # save the gff features
+    gff_output_file = files[0]
+    save_gff(features, gff_output_file)
 
     # extract
     inpair_gff_out = f"{gff_output_file}.in"
     notinpair_gff_out = f"{gff_output_file}.not"
-    extract(dag_output_file, gff_output_file, inpair_gff_out, notinpair_gff_out, extract_first)
+    on_chromosome, anchors = feature_anchors(table, features, extract_first)
+    extract(features, on_chromosome, anchors, inpair_gff_out, 
+            notinpair_gff_out)
 
     # for statistic
     notinpair_gff_out = f"{gff_output_file}.forstat"
-    stat_singleton(dag_output_file, gff_output_file, notinpair_gff_out, extract_first)
+    if stat_dag_dict is None:
+        rows = stat_singleton(table, features, on_chromosome, anchors, 
+                              notinpair_gff_out, extract_first)
+    else:
+        rows = stat_singleton_batches(stat_dag_dict, features, 
+                                      notinpair_gff_out)
 
-    cutoff_para_file = files[4]
-    cutoff = parse_cutoff(cutoff_para_file)
     if cutoff == -1:
-        print(f"No valid cutoff input from file {cutoff_para_file}, skip.")
         return
-    singleton_stat_file = files[5]
-    singletons_between_file = files[6]
-    calculate_t(notinpair_gff_out, singleton_stat_file, singletons_between_file, cutoff)
-
-
-def execute_by_seqtype(dag_input_file, dag_output_file, gff_input_file, 
-                   binormal_cutoff_paras_files, current_dir, 
-                   directory, species, seqtype = "gene"):
-    # first half
-    gff_output_file = os.path.join(current_dir, directory, 
-                                   os.path.basename(species) + '.' + seqtype +
-                                   '.gff')
-    singleton_stat_file = os.path.join(current_dir, directory, 
-                                       os.path.basename(species) + '.' + seqtype +
-                                       '.singleton.t1')
-    singletons_between_file = os.path.join(current_dir, directory, 
-                                           os.path.basename(species) + '.' + seqtype +
-                                           '.singleton_between')
-    files = [dag_input_file, dag_output_file, gff_input_file, 
-             gff_output_file, binormal_cutoff_paras_files, 
-             singleton_stat_file, singletons_between_file]
-    executes(files, extract_first=True, seqtypes = [seqtype])
-
-    # second half
-    gff_output_file = os.path.join(current_dir, directory, 
-                                   os.path.basename(species) + '.' + seqtype +
-                                   '.2.gff')
-    singleton_stat_file = os.path.join(current_dir, directory, 
-                                       os.path.basename(species) + '.' + seqtype +
-                                       '.2.singleton.t1')
-    singletons_between_file = os.path.join(current_dir, directory, 
-                                           os.path.basename(species) + '.' + seqtype +
-                                           '.2.singleton_between')
-    files = [dag_input_file, dag_output_file, gff_input_file, 
-             gff_output_file, binormal_cutoff_paras_files, 
-             singleton_stat_file, singletons_between_file]
-    executes(files, extract_first=False, seqtypes = [seqtype])
+    singleton_stat_file = files[1]
+    singletons_between_file = files[2]
+    calculate_t(rows, singleton_stat_file, singletons_between_file, cutoff)
+
+
+def half_files(current_dir, directory, species, seqtype, half = ""):
+    prefix = os.path.join(current_dir, directory, 
+                          input_stream.species_name(species) + '.' + seqtype + half)
+    return [prefix + '.gff', prefix + '.singleton.t1', 
+            prefix + '.singleton_between']
+
+
+def execute_species(table, gff_table, dag_output_file, 
+                    binormal_cutoff_paras_files, current_dir, 
+                    directory, species, seqtypes = ["gene", "CDS"], 
+                    legacy_singletons = False):
+    """
+    All the (seqtype, half) results of a species from the tables parsed
+    once, the .dag file is saved once as well. legacy_singletons runs the
+    former batch statistic of the singletons instead of the sweep.
+    """
+    # The rows of another genome sequence than their block's are left out.
+    table = dag_parser.drop_mixed_rows(table)
+
+    # save the parsed dag table
+    save_dag(table, dag_output_file)
+
+    cutoff = parse_cutoff(binormal_cutoff_paras_files)
+    if cutoff == -1:
+        print(f"No valid cutoff input from file {binormal_cutoff_paras_files}, skip.")
+
+    # The batch statistic has always looked the anchors on the second
+    # half up by pid rather than fid.
+    halves = [("", True, None), (".2", False, None)]
+    if legacy_singletons:
+        halves = [("", True, anchor_dict(table, extract_first=True)), 
+                  (".2", False, 
+                   anchor_dict(table, extract_first=False, key="pid"))]
+
+    for seqtype in seqtypes:
+        print(f"****** SEQ_TYPE = {seqtype}. ******")
+        features = gff_features(gff_table, [seqtype], table["chromosomes"])
+        for half, extract_first, stat_dag_dict in halves:
+            files = half_files(current_dir, directory, species, seqtype, half)
+            executes(table, extract_first, features, files, cutoff, 
+                     stat_dag_dict)
+
+
+def gff_file(current_dir, species):
+    # The gff file, or its compressed copy or its member in data/gff.tar.gz,
+    # None without any of them.
+    return input_stream.resolve(os.path.join(
+        current_dir, "../data/gff/", input_stream.species_name(species) + ".gff"))
+
+
+def process_species(species, current_dir, directory, parse_jobs = 1, 
+                    legacy_singletons = False):
+    dag_input_file = os.path.join(current_dir, species)
+    gff_input_file = gff_file(current_dir, species)
+    
+    print(f"****** Start dealing with {input_stream.species_name(species)}. ******")
+    if gff_input_file is None:
+        print(f"No gff file for {species}, skip.")
+        return
+    
+    dag_output_file = os.path.join(current_dir, directory, 
+                                   input_stream.species_name(species) + 
+                                   '.dag')
+    binormal_cutoff_paras_files = os.path.join(current_dir, directory, 
+                                               input_stream.species_name(species) + 
+                                               '.binormal_cutoff.parameters')
+    try:
+        gff_table = table_cache.load_gff(gff_input_file)
+    except FileNotFoundError:
+        # not in the archive
+        print(f"No gff file for {species}, skip.")
+        return
+    table = table_cache.load_dag(dag_input_file, parse_jobs)
+    execute_species(table, gff_table, dag_output_file, 
+                    binormal_cutoff_paras_files, current_dir, 
+                    directory, species, 
+                    legacy_singletons=legacy_singletons)
 
 
 def main(args):
-    species_list = calculate_simi.parse_species_list(args)
+    # --jobs N runs N species at once
+    args, jobs = species_pool.parse_jobs(args)
+    species_list = input_stream.parse_species_list(args)
     if species_list is None or len(species_list) <= 0:
         print("No valid input.")
         return
@@ -482,34 +509,19 @@ def main(args):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+    # True takes the flanks of the singletons from their batches in the 
+    # gff file order, as before the sweep, for the former results.
+    legacy_singletons = False
+
     # species_list = ['rainbow_trout', 'chum_salmon']
-    for species in species_list:
-        dag_input_file = os.path.join(current_dir, species)
-        gff_input_file = os.path.join(current_dir, "../data/gff/", 
-                                      os.path.basename(species) + ".gff")
-        
-        print(f"****** Start dealing with {os.path.basename(species)}. ******")
-        if not os.path.isfile(gff_input_file):
-            print(f"No gff file for {species}, skip.")
-            continue
-        
-        dag_output_file = os.path.join(current_dir, directory, 
-                                       os.path.basename(species) + 
-                                       '.dag')
-        binormal_cutoff_paras_files = os.path.join(current_dir, directory, 
-                                                   os.path.basename(species) + 
-                                                   '.binormal_cutoff.parameters')
-        
-        # gene
-        print(f"****** SEQ_TYPE = gene. ******")
-        execute_by_seqtype(dag_input_file, dag_output_file, gff_input_file, 
-                       binormal_cutoff_paras_files, current_dir, 
-                       directory, species, seqtype = "gene")
-        # CDS
-        print(f"****** SEQ_TYPE = CDS. ******")
-        execute_by_seqtype(dag_input_file, dag_output_file, gff_input_file, 
-                       binormal_cutoff_paras_files, current_dir, 
-                       directory, species, seqtype = "CDS")
+    worker = functools.partial(process_species, current_dir=current_dir, 
+                               directory=directory, 
+                               legacy_singletons=legacy_singletons, 
+                               parse_jobs=species_pool.jobs_per_species(
+                                   jobs, len(species_list)))
+    footprints = [species_pool.footprint([species, gff_file(current_dir, species)])
+                  for species in species_list]
+    species_pool.map_species(worker, species_list, jobs, footprints)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,21 @@
 import os
 import sys
-import calculate_simi
+import time
+import functools
+import numpy as np
+import dag_parser
+import table_cache
+import species_pool
 # import cutoff_binormal
 import extract_singletons
+import input_stream
 from collections import OrderedDict
 
 
+# The layout of the triangle table cached by load_triples.
+TRIPLE_TABLE_VERSION = 1
+
+
 # def find_binormal_cutoffs(block_sim_data, 
 #                           binormal_cutoffs_parameters, 
 #                           binormal_cutoffs_plot):
@@ -18,53 +28,44 @@ from collections import OrderedDict
 #     return cutoff
     
 
-def traverse_each_species(file_path, debug_rows_count = 0):
-    genome_pair_sim = {}
-    with open(file_path, 'r') as file:
-        row_id = 0
-
-        for line in file:
-            row_id += 1
-            line = line.strip()
-
-            # For debug
-            if debug_rows_count > 0 and row_id == debug_rows_count:
-                break
-
-            if line.startswith("#"):
-                continue
-
-            # check data validation
-            fields = line.split('\t')
-            if len(fields) != 12:
-                if not line.startswith("#"):
-                    print(f"Invalid line {row_id} with {len(fields)} fields.")
-                continue
-
-            # chr1||start1||stop1||name1||strand1||type1||db_feature_id1||genome_order1||percent_id1
-            # chr2||start2||stop2||name2||strand2||type2||db_feature_id2||genome_order2||percent_id2
-            chain_info = fields[3].split('||')
-            chain_info_2 = fields[7].split('||')
-            if len(chain_info) != 9 or len(chain_info_2) != 9:
-                # print(f"Invalid line {row_id} with fault columns for the two genome sequence.")
-                continue
-
-            genome_segment = int(chain_info[6])
-            genome_segment_2 = int(chain_info_2[6])
-            # ensure genome_segment is not greater than genome_segment_2
-            if genome_segment > genome_segment_2:
-                tmp = genome_segment
-                genome_segment = genome_segment_2
-                genome_segment_2 = tmp
-            similarity = float(chain_info[-1])
-
-            new_pair = (genome_segment, genome_segment_2)
-            if new_pair in genome_pair_sim:
-                # print(f"Invalid line {row_id} which contains the same genome segment pairs with previous lines.")
-                continue
-            genome_pair_sim[new_pair] = similarity
-
-    return genome_pair_sim
+def traverse_each_species(table):
+    """
+    The distinct genome segment pairs of the table, as a compact store
+    instead of a dict of tuples. A pair (a, b) is normalized to a <= b and
+    packed into the int64 key rank(a) * n + rank(b), rank being the
+    position among the n sorted unique "fids". The sorted unique "keys"
+    come with the identities (centi-percents) of the first rows having
+    them, "sims", and the "order" in which these rows come in the table.
+    The "mixed" rows are taken as well, as the triplets always have.
+    """
+    fid1 = table["fid1"]
+    fid2 = table["fid2"]
+    fids, ranks = np.unique(np.concatenate([np.minimum(fid1, fid2), 
+                                            np.maximum(fid1, fid2)]), 
+                            return_inverse=True)
+    ranks = ranks.reshape(2, -1).astype(np.int64)
+    # the later rows of the same genome segment pairs are left out
+    keys, first_rows = np.unique(ranks[0] * len(fids) + ranks[1], 
+                                 return_index=True)
+    order = np.empty(len(keys), dtype=np.int64)
+    order[np.argsort(first_rows, kind='stable')] = np.arange(len(keys))
+    return {"fids": fids, "keys": keys, "sims": table["pid1"][first_rows], 
+            "order": order}
+
+
+def pair_count(genome_pair_sim):
+    return len(genome_pair_sim["keys"])
+
+
+def find_pairs(genome_pair_sim, lows, highs):
+    # The store indices of the pairs of fid ranks lows <= highs, -1 if not
+    # in the store.
+    keys = genome_pair_sim["keys"]
+    wanted = lows * len(genome_pair_sim["fids"]) + highs
+    found = np.minimum(np.searchsorted(keys, wanted), max(len(keys) - 1, 0))
+    if len(keys) == 0:
+        return np.full(len(wanted), -1, dtype=np.int64)
+    return np.where(keys[found] == wanted, found, -1)
 
 
 def judge_side(cutoff, similarity):
@@ -74,79 +75,282 @@ def judge_side(cutoff, similarity):
         return "t2"
 
 
-def count_t1(tlist):
-    t1_count = 0
-    for ele in tlist:
-        if ele == "t1":
-            t1_count += 1
-    return t1_count
+def build_adjacency(genome_pair_sim):
+    """
+    The pairs of two different genome segments as edges, each one oriented
+    from the lower ranked segment to the higher one, rank by (degree, fid),
+    and grouped by their first segment. Return the edges as fid ranks and
+    the number of segments with any edge.
+    """
+    n_fids = len(genome_pair_sim["fids"])
+    keys = genome_pair_sim["keys"]
+    lows = keys // n_fids
+    highs = keys % n_fids
+    distinct = lows != highs
+    lows = lows[distinct]
+    highs = highs[distinct]
+
+    degrees = np.bincount(np.concatenate([lows, highs]), minlength=n_fids)
+    position = np.empty(n_fids, dtype=np.int64)
+    position[np.lexsort((np.arange(n_fids), degrees))] = np.arange(n_fids)
+
+    forward = position[lows] < position[highs]
+    sources = np.where(forward, lows, highs)
+    targets = np.where(forward, highs, lows)
+    edge_order = np.lexsort((position[targets], position[sources]))
+    return (sources[edge_order], targets[edge_order], 
+            int(np.count_nonzero(degrees)))
+
+
+def enumerate_triangles(genome_pair_sim, sources, targets, 
+                        batch_wedges = 1 << 22):
+    """
+    Every triangle exactly once, from its lowest ranked segment: the two
+    edges out of a segment close a triangle when their targets are a pair
+    of the store. With the edges oriented by (degree, fid) a segment has
+    O(sqrt(P)) edges out, which gives O(P * sqrt(P)) candidates in total,
+    checked batch_wedges at a time by binary search over the keys.
+    Return the triangles as rows of three ascending fid ranks.
+    """
+    # the edges out of a segment are edges [group_starts[g], group_stops[g])
+    boundaries = np.flatnonzero(np.diff(sources)) + 1
+    group_starts = np.r_[0, boundaries]
+    group_stops = np.r_[boundaries, len(sources)]
+    # the candidates of an edge, with the later edges of its group
+    later = np.repeat(group_stops, group_stops - group_starts) - \
+        np.arange(len(sources)) - 1
+    cumulative = np.cumsum(later)
+
+    triangles = []
+    start = 0
+    while start < len(sources):
+        done = cumulative[start - 1] if start > 0 else 0
+        stop = max(int(np.searchsorted(cumulative, done + batch_wedges, 
+                                       side='right')), start + 1)
+        counts = later[start:stop]
+        firsts = np.repeat(np.arange(start, stop), counts)
+        seconds = firsts + 1 + np.arange(len(firsts)) - \
+            np.repeat(np.cumsum(counts) - counts, counts)
+        ends = np.sort(np.stack([targets[firsts], targets[seconds]]), axis=0)
+        closed = find_pairs(genome_pair_sim, ends[0], ends[1]) >= 0
+        triangles.append(np.stack([sources[firsts[closed]], 
+                                   targets[firsts[closed]], 
+                                   targets[seconds[closed]]], axis=1))
+        start = stop
+    if not triangles:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.sort(np.concatenate(triangles), axis=1)
+
+
+def discovery_order(triangles, pair_rows, genome_pair_sim):
+    # The former pairwise scan found the triplet (a, b, c) at the first
+    # (pair1, pair2) among ((a, b), (a, c)), ((a, b), (b, c)) and
+    # ((a, c), (b, c)), in the order of the pairs in the table.
+    ab, ac, bc = genome_pair_sim["order"][pair_rows].T
+    first = np.where(ab < ac, ab, ac)
+    second = np.where(ab < ac, np.minimum(ac, bc), bc)
+    return np.lexsort((second, first))
+
+
+def find_triples(genome_pair_sim):
+    """
+    Find the triplets of the genome segments, every two of them a pair of
+    genome_pair_sim (see traverse_each_species). Return the triangle
+    table: the three "fids" of each triplet, ascending, the "sims" of
+    (a, b), (a, c) and (b, c), in the former order of discovery, and the
+    numbers of "pairs" and "segments" they were found among. It does not
+    depend on the cutoff, see load_triples.
+    """
+    phase_start = time.perf_counter()
+    sources, targets, n_segments = build_adjacency(genome_pair_sim)
+    index_time = time.perf_counter() - phase_start
+
+    phase_start = time.perf_counter()
+    triangles = enumerate_triangles(genome_pair_sim, sources, targets)
+    pair_rows = np.stack([find_pairs(genome_pair_sim, triangles[:, 0], triangles[:, 1]),
+                          find_pairs(genome_pair_sim, triangles[:, 0], triangles[:, 2]),
+                          find_pairs(genome_pair_sim, triangles[:, 1], triangles[:, 2])],
+                         axis=1)
+    order = discovery_order(triangles, pair_rows, genome_pair_sim)
+    triples = {"fids": genome_pair_sim["fids"][triangles[order]], 
+               "sims": genome_pair_sim["sims"][pair_rows[order]], 
+               "pairs": pair_count(genome_pair_sim), 
+               "segments": n_segments}
+    enumerate_time = time.perf_counter() - phase_start
+
+    print(f"Found {len(order)} triplets among {triples['pairs']} pairs "
+          f"and {n_segments} genome segments.")
+    print(f"Time: adjacency index {index_time:.3f}s, "
+          f"triangle enumeration {enumerate_time:.3f}s.")
+    return triples
+
+
+def triple_table_version():
+    # The triangles are built from the block table and keep its identity
+    # encoding, a new layout of either one makes the cached table stale.
+    return f"{TRIPLE_TABLE_VERSION}.{dag_parser.TABLE_VERSION}"
 
 
+def load_triples(input_file, parse_jobs = 1):
+    # The triangle table of a dag file, cached next to its block table, so
+    # that another cutoff needs neither the dag file nor the enumeration.
+    return table_cache.load("triplets", input_file, 
+                            lambda: find_triples(traverse_each_species(
+                                table_cache.load_dag(input_file, parse_jobs))), 
+                            triple_table_version())
 
-def extract_triples(genome_pair_sim, similarity_cutoff, triple_output_file, triple_t1_output_file):
-    triples = {}
-    pairs = genome_pair_sim.keys()
-    # print(pairs)
-
-    #Identify unique elements in the list of pairs
-    unique_elements = set()
-    for pair in pairs:
-        unique_elements.update(pair)
-
-    for pair1 in pairs:
-        for pair2 in pairs:
-            if pair1 != pair2:
-                common_element = None
-                for element in pair1:
-                    if element in pair2 and element in unique_elements:
-                        common_element = element
-                        break
-
-                if common_element:
-                    remaining_elements = [e for e in pair1 + pair2 if e != common_element]
-                    # (A, B), (A, C) and (B, C) should all appear in the pairs
-                    if (remaining_elements[0], remaining_elements[1]) in pairs:
-                        triple = [common_element] + remaining_elements
-                        triple.sort()  # Sort for consistency
-                        triple = tuple(triple)
-                        if triple not in triples:
-                            triples[triple] = [genome_pair_sim[(triple[0], triple[1])], 
-                                               genome_pair_sim[(triple[0], triple[2])],
-                                               genome_pair_sim[(triple[1], triple[2])]]
-
-    # Stat t1 & t2 combinations
+
+def stat_triples(triples, similarity_cutoff):
+    # {number of t1 pairs: number of triplets}, for the cutoff rounded as
+    # in the .triplets file, the counts in one vectorized pass.
+    pid_cutoff = dag_parser.pid_cutoff(round(similarity_cutoff, 2))
+    t1_counts = np.count_nonzero(np.asarray(triples["sims"]) <= pid_cutoff, 
+                                 axis=1)
     stat_rs = {}
+    for t1_count, count in enumerate(np.bincount(t1_counts).tolist()):
+        if count > 0:
+            stat_rs[t1_count] = count
+    return stat_rs
 
+
+def save_triple_t1(stat_rs, triple_t1_output_file):
+    with open(triple_t1_output_file, 'w') as tpf:
+        sorted_stat_rs = {}
+        for k, v in OrderedDict(sorted(stat_rs.items())).items():
+            sorted_stat_rs[k] = v
+        tpf.write(f"\nTriplet Statistics by t1: {sorted_stat_rs}\n")
+
+
+def write_triples(triples, similarity_cutoff, triple_output_file, triple_t1_output_file):
+    # Write the triplets of find_triples with their sides of the cutoff.
+    phase_start = time.perf_counter()
     if triple_output_file:
         with open(triple_output_file, 'w') as pf:
             similarity_cutoff = round(similarity_cutoff, 2)
             pf.write(f"Cutoff point: {similarity_cutoff}\n")
-            for triple in triples:
-                sims = triples[triple]
-                the1 = judge_side(similarity_cutoff, sims[0])
-                the2 = judge_side(similarity_cutoff, sims[1])
-                the3 = judge_side(similarity_cutoff, sims[2])
-                pf.write(f"{triple[0]}, {triple[1]}: {sims[0]}\t")
-                pf.write(f"{triple[0]}, {triple[2]}: {sims[1]}\t")
-                pf.write(f"{triple[1]}, {triple[2]}: {sims[2]}\t")
+            pid_cutoff = dag_parser.pid_cutoff(similarity_cutoff)
+            texts = {}
+            for sim in np.unique(triples["sims"]).tolist():
+                texts[sim] = dag_parser.pid_text(sim)
+            for triple, sims in zip(triples["fids"].tolist(), 
+                                    triples["sims"].tolist()):
+                the1 = judge_side(pid_cutoff, sims[0])
+                the2 = judge_side(pid_cutoff, sims[1])
+                the3 = judge_side(pid_cutoff, sims[2])
+                pf.write(f"{triple[0]}, {triple[1]}: {texts[sims[0]]}\t")
+                pf.write(f"{triple[0]}, {triple[2]}: {texts[sims[1]]}\t")
+                pf.write(f"{triple[1]}, {triple[2]}: {texts[sims[2]]}\t")
                 pf.write(f"{the1}, ")
                 pf.write(f"{the2}, ")
                 pf.write(f"{the3}\n")
 
-                t1_count = count_t1([the1, the2, the3])
-                if t1_count not in stat_rs:
-                    stat_rs[t1_count] = 0
-                stat_rs[t1_count] += 1
-        
-        with open(triple_t1_output_file, 'w') as tpf:
-            sorted_stat_rs = {}
-            for k, v in OrderedDict(sorted(stat_rs.items())).items():
-                sorted_stat_rs[k] = v
-            tpf.write(f"\nTriplet Statistics by t1: {sorted_stat_rs}\n")
-    
+        # Stat t1 & t2 combinations
+        save_triple_t1(stat_triples(triples, similarity_cutoff), 
+                       triple_t1_output_file)
+    print(f"Time: output {time.perf_counter() - phase_start:.3f}s.")
     return triples
 
 
+def extract_triples(genome_pair_sim, similarity_cutoff, triple_output_file, triple_t1_output_file):
+    return write_triples(find_triples(genome_pair_sim), similarity_cutoff, 
+                         triple_output_file, triple_t1_output_file)
+
+
+def species_cutoff(output_prefix):
+    # The binormal cutoff of the species, -1 if there is none.
+    cutoff_para_file = output_prefix + '.binormal_cutoff.parameters'
+    similarity_cutoff = extract_singletons.parse_cutoff(cutoff_para_file)
+    if similarity_cutoff == -1:
+        print(f"No valid cutoff input from file {cutoff_para_file}, skip.")
+    return similarity_cutoff
+
+
+def extract_species_triples(input_file, output_prefix, parse_jobs = 1):
+    # The triplets stage of one species, False without a valid cutoff.
+    # Step 1: Parse cutoff from pair extracting result
+    # blocks_avg_sim = calculate_simi.parse_dagchainer_output(input_file)
+    # similarity_cutoff = find_binormal_cutoffs(blocks_avg_sim, None, None)
+    similarity_cutoff = species_cutoff(output_prefix)
+    if similarity_cutoff == -1:
+        return False
+
+    ### Step 2 & 3, the triplets found once per dag file
+    triples = load_triples(input_file, parse_jobs)
+
+    triple_output_file = output_prefix + '.triplets'
+    triple_t1_output_file = output_prefix + '.triplets.t1'
+    write_triples(triples, similarity_cutoff, 
+                  triple_output_file, triple_t1_output_file)
+    return True
+
+
+def reclassify_species_triples(input_file, output_prefix, 
+                               similarity_cutoff = None, parse_jobs = 1):
+    """
+    Recount the .triplets.t1 histogram from the cached triangle table.
+    Without similarity_cutoff, <prefix>.triplets.t1 is rewritten for the
+    cutoff of the .binormal_cutoff.parameters file. Another cutoff goes to
+    <prefix>.triplets.t1.<cutoff>, the outputs of the stage keep the
+    binormal one.
+    """
+    triple_t1_output_file = output_prefix + '.triplets.t1'
+    if similarity_cutoff is None:
+        similarity_cutoff = species_cutoff(output_prefix)
+        if similarity_cutoff == -1:
+            return False
+    else:
+        triple_t1_output_file += f".{round(similarity_cutoff, 2)}"
+
+    triples = load_triples(input_file, parse_jobs)
+    phase_start = time.perf_counter()
+    stat_rs = stat_triples(triples, similarity_cutoff)
+    save_triple_t1(stat_rs, triple_t1_output_file)
+    print(f"Reclassified {len(triples['sims'])} triplets at cutoff "
+          f"{round(similarity_cutoff, 2)} in "
+          f"{time.perf_counter() - phase_start:.3f}s: {stat_rs}, "
+          f"saved to {triple_t1_output_file}.")
+    return True
+
+
+def parse_reclassify(args):
+    """
+    Take "--reclassify" and "--cutoff X" (or "--cutoff=X") out of args.
+    Return the remaining args, whether to reclassify, and X, None for the
+    binormal cutoff. "--cutoff X" implies "--reclassify".
+    """
+    rest = []
+    reclassify = False
+    cutoff = None
+    i = 0
+    while i < len(args):
+        if args[i] == "--cutoff" and i + 1 < len(args):
+            reclassify = True
+            cutoff = float(args[i + 1])
+            i += 2
+            continue
+        if args[i].startswith("--cutoff="):
+            reclassify = True
+            cutoff = float(args[i].split("=", 1)[1])
+        elif args[i] == "--reclassify":
+            reclassify = True
+        else:
+            rest.append(args[i])
+        i += 1
+    return rest, reclassify, cutoff
+
+
+def process_species(species, current_dir, directory, parse_jobs = 1, 
+                    reclassify = False, cutoff = None):
+    print(f"****** Start dealing with {input_stream.species_name(species)} ******")
+    input_file = os.path.join(current_dir, species)
+    output_prefix = os.path.join(current_dir, directory, 
+                                 input_stream.species_name(species))
+    if reclassify:
+        return reclassify_species_triples(input_file, output_prefix, 
+                                          cutoff, parse_jobs)
+    return extract_species_triples(input_file, output_prefix, parse_jobs)
+
+
 def main(args):
     """
     Step 1: get the cutoff of the current species
@@ -154,8 +358,14 @@ def main(args):
             record the {<gene_segment_01, gene_segment_02>, similarity} pairs.
     Step 3: extract triple information
     """
+    # --jobs N runs N species at once
+    args, jobs = species_pool.parse_jobs(args)
+    # --reclassify rewrites the .triplets.t1 files only, from the cached
+    # triplets, --cutoff X writes .triplets.t1.X files with X instead of
+    # the binormal cutoff
+    args, reclassify, cutoff = parse_reclassify(args)
     ### Step 1
-    species_list = calculate_simi.parse_species_list(args)
+    species_list = input_stream.parse_species_list(args)
     if species_list is None or len(species_list) <= 0:
         print("No valid input.")
         return
@@ -170,33 +380,12 @@ def main(args):
         os.makedirs(directory)
 
     # species_list = ['rainbow_trout', 'chum_salmon']
-    for species in species_list:
-        print(f"****** Start dealing with {os.path.basename(species)} ******")
-        input_file = os.path.join(current_dir, species)
-
-        # Step 1: Parse cutoff from pair extracting result
-        # blocks_avg_sim = calculate_simi.parse_dagchainer_output(input_file)
-        # similarity_cutoff = find_binormal_cutoffs(blocks_avg_sim, None, None)
-        cutoff_para_file = os.path.join(current_dir, directory, 
-                                        os.path.basename(species) + 
-                                        '.binormal_cutoff.parameters')
-        similarity_cutoff = extract_singletons.parse_cutoff(cutoff_para_file)
-        if similarity_cutoff == -1:
-            print(f"No valid cutoff input from file {cutoff_para_file}, skip.")
-            return
-
-        ### Step 2
-        genome_pair_sim = traverse_each_species(input_file)
-
-        ### Step 3
-        triple_output_file = os.path.join(current_dir, directory, 
-                                          os.path.basename(species) + 
-                                          '.triplets')
-        triple_t1_output_file = os.path.join(current_dir, directory, 
-                                          os.path.basename(species) + 
-                                          '.triplets.t1')
-        extract_triples(genome_pair_sim, similarity_cutoff, 
-                        triple_output_file, triple_t1_output_file)
+    worker = functools.partial(process_species, current_dir=current_dir, 
+                               directory=directory, 
+                               reclassify=reclassify, cutoff=cutoff, 
+                               parse_jobs=species_pool.jobs_per_species(
+                                   jobs, len(species_list)))
+    species_pool.map_species(worker, species_list, jobs)
 
 
 if __name__ == "__main__":
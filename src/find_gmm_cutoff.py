@@ -1,51 +1,46 @@
 import numpy as np
-from sklearn.mixture import GaussianMixture
-
-def find_gmm_cutoff(ori_data, parameter_file_name):
-    # Reshape data to a column vector if necessary
-    data = np.array(ori_data).reshape(-1, 1)
-    
+import weighted_sample
+import bootstrap
+
+def search_cutoff(score_samples, sample):
+    # Score every unique value once, then the log-likelihood of the points
+    # on either side of each candidate cutoff is a prefix (or suffix) sum
+    # over the sorted scores, weighted by the counts.
+    values = sample.values
+    scores = score_samples(values.reshape(-1, 1)) * sample.counts
+    prefix = np.concatenate(([0.0], np.cumsum(scores)))
+    suffix = np.concatenate((np.cumsum(scores[::-1])[::-1], [0.0]))
+
+    # Every unique value but the first is a candidate, left is
+    # data < cutoff and right is data >= cutoff.
+    if len(values) < 2:
+        return None
+    left_likelihood = prefix[1:len(values)]
+    right_likelihood = suffix[1:len(values)]
+
+    # Calculate the total likelihood
+    total_likelihood = left_likelihood * right_likelihood
+
+    # Keep the shape of the former cutoffs, i.e. a row of the data.
+    best = 1 + np.argmax(total_likelihood)
+    return values[best:best + 1]
+
+
+def gmm_cutoff(sample):
     # Fit a Gaussian Mixture Model with two components
     n_components = 2
-    gmm = GaussianMixture(n_components=n_components)
-    gmm.fit(data)
-
-    # Calculate the posterior probabilities
-    # posterior_probs = gmm.predict_proba(data)
-    #print(posterior_probs)
+    gmm = weighted_sample.fit_gmm(sample, n_components=n_components)
 
     # Find the optimal cutoff by maximizing the likelihood
-    max_likelihood = -np.inf
-    optimal_cutoff = None
-
-    # The first two set were even more wrong.
-    # for cutoff in np.linspace(np.min(data), np.max(data), 100):
-    # for cutoff in np.unique(data):
-    for cutoff in data:
-        # Assign data points to components based on the posterior probabilities
-        # left_component = data[posterior_probs[:, 0] > posterior_probs[:, 1]]
-        #print(left_component)
-        # right_component = data[posterior_probs[:, 0] <= posterior_probs[:, 1]]
-        
-        left_component = data[data < cutoff].reshape(-1, 1)
-        right_component = data[data >= cutoff].reshape(-1, 1)
-        #print(right_component)
-
-        # filter the first data point
-        if not len(left_component):
-            continue
-
-        # Calculate the log-likelihood of each component
-        left_likelihood = gmm.score_samples(left_component).sum()
-        right_likelihood = gmm.score_samples(right_component).sum()
-
-        # Calculate the total likelihood
-        total_likelihood = left_likelihood * right_likelihood
-
-        # Update the maximum likelihood and cutoff if necessary
-        if total_likelihood > max_likelihood:
-            max_likelihood = total_likelihood
-            optimal_cutoff = cutoff
+    return search_cutoff(
+        lambda x: weighted_sample.gmm_score_samples(gmm, x), sample)
+
+
+def find_gmm_cutoff(ori_data, parameter_file_name, 
+                    n_bootstrap = 0, seed = 0, jobs = None):
+    # Work on the unique values weighted by their counts
+    sample = weighted_sample.as_sample(ori_data)
+    optimal_cutoff = gmm_cutoff(sample)
 
     # print("Optimal Cutoff:", optimal_cutoff)
     
@@ -53,6 +48,11 @@ def find_gmm_cutoff(ori_data, parameter_file_name):
     with open(parameter_file_name, 'w') as pf:
         pf.write(str(optimal_cutoff))
         pf.write("\n")
+        # Percentile interval of the cutoff over bootstrap resamples
+        if n_bootstrap > 0:
+            cutoffs = bootstrap.bootstrap(sample, gmm_cutoff, 
+                                          n_bootstrap, seed, jobs)
+            pf.write(f"{bootstrap.format_interval(cutoffs)}\n")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,13 @@
 from fitter import Fitter
 from scipy import stats
 import matplotlib.pyplot as plt
+import weighted_sample
 
 # simulation of distribution
 # reference: https://zhuanlan.zhihu.com/p/420047068
 def simulate_distribution(data, plot_file_name, parameter_file_name):
+    # Fitter has no sample weights, thus expand the counts again.
+    data = weighted_sample.expand(weighted_sample.as_sample(data))
     f = Fitter(data)
     f.fit()
     with open(parameter_file_name, 'w') as pf:
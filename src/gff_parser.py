@@ -0,0 +1,80 @@
+import numpy as np
+import dag_parser
+import input_stream
+
+
+# Bump it whenever the layout of the table changes, so that cached
+# tables are parsed again.
+TABLE_VERSION = 1
+
+DEFAULT_SEQTYPES = ("gene", "CDS")
+
+
+def parse_gff_table(file_path, seqtypes = DEFAULT_SEQTYPES):
+    """
+    Read a GFF file once and return the features of the given seqtypes
+    as columns, in file order. A feature without a coge_fid gets fid -1.
+    """
+    chromosomes = []
+    chromosome_ids = {}
+    seqtype_ids = {}
+    for seq_type in seqtypes:
+        seqtype_ids[seq_type] = len(seqtype_ids)
+
+    chrs = []
+    types = []
+    starts = []
+    ends = []
+    reverses = []
+    fids = []
+
+    for row_id, line in enumerate(input_stream.read_lines(file_path), 1):
+        line = line.decode().strip()
+
+        if not line:
+            continue
+
+        # Ignore lines that start with "#"
+        if line.startswith("#"):
+            continue
+
+        fields = line.split("\t")
+        if len(fields) < 9:
+            continue
+
+        seq_type = fields[2]
+        if seq_type not in seqtype_ids:
+            continue
+
+        subfields = fields[-1].split(";")
+        fid = -1
+        for i in range(len(subfields) - 1, 0, -1):
+            if "coge_fid=" in subfields[i]:
+                fid = subfields[i].split("=")[-1]
+                break
+        # The fids are integers in the dag files, no other one can match.
+        if fid != -1:
+            if not fid.isdigit():
+                print(f"Invalid line {row_id} with coge_fid {fid}, skip.")
+                continue
+            fid = int(fid)
+
+        chrs.append(dag_parser.intern(chromosomes, chromosome_ids,
+                                      fields[0]))
+        types.append(seqtype_ids[seq_type])
+        starts.append(int(fields[3]))
+        ends.append(int(fields[4]))
+        reverses.append(1 if fields[6] == "+" else -1)
+        fids.append(fid)
+
+    return {
+        "file_path": file_path,
+        "chromosomes": chromosomes,
+        "seqtypes": list(seqtypes),
+        "chr": np.array(chrs, dtype=np.int32),
+        "seqtype": np.array(types, dtype=np.int8),
+        "start": np.array(starts, dtype=np.int64),
+        "end": np.array(ends, dtype=np.int64),
+        "reverse": np.array(reverses, dtype=np.int8),
+        "fid": np.array(fids, dtype=np.int64),
+    }
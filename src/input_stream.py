@@ -0,0 +1,235 @@
+import io
+import os
+import bz2
+import gzip
+import lzma
+import queue
+import tarfile
+import threading
+
+
+DECOMPRESSORS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+TAR_SUFFIXES = [".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"]
+# A member of a tar archive is named "<archive>::<member>".
+MEMBER_SEPARATOR = "::"
+
+CHUNK_SIZE = 1 << 20
+# Decompress in a background thread, a few chunks ahead of the parser.
+# zlib, bz2 and lzma release the GIL, so both run at the same time.
+BACKGROUND = True
+BACKGROUND_CHUNKS = 8
+
+
+def split_member(spec):
+    # (archive, member) of a tar member, (file, None) otherwise
+    if MEMBER_SEPARATOR in spec:
+        archive, member = spec.split(MEMBER_SEPARATOR, 1)
+        return archive, member
+    return spec, None
+
+
+def compression(file_path):
+    for suffix in DECOMPRESSORS:
+        if file_path.endswith(suffix):
+            return suffix
+    return None
+
+
+def is_tar(file_path):
+    for suffix in TAR_SUFFIXES:
+        if file_path.endswith(suffix):
+            return True
+    return False
+
+
+def source_path(spec):
+    # The file on disk, e.g. to stat it.
+    return split_member(spec)[0]
+
+
+def is_plain(spec):
+    # An uncompressed file, which can be read from any offset.
+    archive, member = split_member(spec)
+    return member is None and compression(archive) is None
+
+
+def species_name(spec):
+    # The base name of the file or member, without the compression suffix.
+    archive, member = split_member(spec)
+    name = os.path.basename(archive if member is None else member)
+    suffix = compression(name)
+    if suffix is not None:
+        name = name[:-len(suffix)]
+    return name
+
+
+def resolve(file_path):
+    """
+    Where to read file_path from: the file itself, the file compressed
+    next to it (e.g. chum_salmon.gff.gz), or a member of the tar archive
+    of one of its directories (e.g. data/gff.tar.gz::gff/chum_salmon.gff).
+    None if none of them exists. The member itself is only looked for when
+    it is read.
+    """
+    if os.path.isfile(file_path):
+        return file_path
+    for suffix in DECOMPRESSORS:
+        if os.path.isfile(file_path + suffix):
+            return file_path + suffix
+
+    head, member = os.path.split(os.path.normpath(os.path.abspath(file_path)))
+    while head != os.path.dirname(head):
+        for suffix in TAR_SUFFIXES:
+            if os.path.isfile(head + suffix):
+                return (head + suffix + MEMBER_SEPARATOR +
+                        os.path.basename(head) + "/" + member)
+        member = os.path.basename(head) + "/" + member
+        head = os.path.dirname(head)
+    return None
+
+
+def list_members(archive):
+    # The specs of the regular files in a tar archive, in archive order.
+    specs = []
+    with tarfile.open(archive, mode="r|*") as tar:
+        for info in tar:
+            if info.isfile():
+                specs.append(archive + MEMBER_SEPARATOR +
+                             os.path.normpath(info.name))
+    return specs
+
+
+def add_species(species_list, file_path):
+    # A tar archive stands for the files inside it, as "<archive>::<member>".
+    if is_tar(file_path) and split_member(file_path)[1] is None:
+        species_list.extend(list_members(file_path))
+    else:
+        species_list.append(file_path)
+
+
+def parse_species_list(args):
+    species_list = []
+    
+    if len(args) < 2:
+        print("Please provide a file, "
+              "or several files with semicolon as separator, "
+              "or folder as an argument.")
+    else:
+        paths = args[1:]
+        print(f"Your input path: {paths}.\n")
+        for path in paths:
+            if os.path.isfile(source_path(path)):
+                add_species(species_list, path)
+            elif os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    for file in files:
+                        file_path = os.path.join(root, file)
+                        add_species(species_list, file_path)
+            else:
+                filenames = path.split(";")
+                for filename in filenames:
+                    if os.path.isfile(source_path(filename)):
+                        add_species(species_list, filename)
+                    else:
+                        print(f"Invalid file: {filename} "
+                              "inside the list you input.")
+                        
+    return species_list
+
+
+def read_chunks(spec, start = 0, chunk_size = CHUNK_SIZE):
+    archive, member = split_member(spec)
+    if member is None:
+        opener = DECOMPRESSORS.get(compression(archive), open)
+        with opener(archive, 'rb') as fin:
+            if start > 0:
+                fin.seek(start)
+            for chunk in iter(lambda: fin.read(chunk_size), b""):
+                yield chunk
+        return
+
+    with tarfile.open(archive, mode="r|*") as tar:
+        for info in tar:
+            if info.isfile() and os.path.normpath(info.name) == \
+                    os.path.normpath(member):
+                fin = tar.extractfile(info)
+                if start > 0:
+                    fin.read(start)
+                for chunk in iter(lambda: fin.read(chunk_size), b""):
+                    yield chunk
+                return
+    raise FileNotFoundError(f"No {member} in {archive}")
+
+
+def in_background(chunks, depth = BACKGROUND_CHUNKS):
+    # Run the chunks generator in a thread, at most depth chunks ahead.
+    # Its errors are raised here, and it stops when this one is closed.
+    buffer = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(None)
+        except BaseException as error:
+            put(error)
+        finally:
+            chunks.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def read_lines(spec, start = 0, background = BACKGROUND):
+    """
+    The lines (bytes, with their line ends) of a plain or compressed file
+    or a tar member, from the uncompressed offset start on. Compressed
+    inputs are streamed, never extracted to disk.
+    """
+    if is_plain(spec):
+        with open(spec, 'rb') as fin:
+            fin.seek(start)
+            for line in fin:
+                yield line
+        return
+
+    chunks = read_chunks(spec, start)
+    if background:
+        chunks = in_background(chunks)
+    # The pieces of the line going on in the next chunk, joined only once
+    # it ends, so that a long line is not copied again at every chunk.
+    pieces = []
+    for chunk in chunks:
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            pieces.append(chunk)
+            continue
+        pieces.append(chunk[:end])
+        for line in io.BytesIO(b"".join(pieces)):
+            yield line
+        pieces = [chunk[end:]]
+    rest = b"".join(pieces)
+    if rest:
+        yield rest
@@ -0,0 +1,77 @@
+import numpy as np
+import weighted_sample
+
+
+def new_accumulator(bins, scale):
+    """
+    The sufficient statistics of a stream of non-negative integers standing
+    for code / scale, e.g. identities in centi-percents: the "histogram" of
+    the codes in [0, bins), and the "count", "mean" and sum of squared
+    deviations "m2" of the values as Welford's algorithm keeps them. It is
+    fed with add, in any chunks, and accumulators of the same bins and scale
+    from other chunks or processes are combined with merge.
+    """
+    return {
+        "scale": scale,
+        "histogram": np.zeros(bins, dtype=np.int64),
+        "count": 0,
+        "mean": 0.0,
+        "m2": 0.0,
+    }
+
+
+def combine_moments(acc, count, mean, m2):
+    # Chan et al.'s update of Welford's moments by those of another chunk.
+    if count == 0:
+        return
+    total = acc["count"] + count
+    delta = mean - acc["mean"]
+    acc["mean"] += delta * count / total
+    acc["m2"] += m2 + delta * delta * acc["count"] * count / total
+    acc["count"] = total
+
+
+def add(acc, codes, weights = None):
+    # Add the codes, each one weights times (once by default).
+    codes = np.asarray(codes, dtype=np.int64).ravel()
+    if len(codes) == 0:
+        return acc
+    if weights is None:
+        weights = np.ones(len(codes), dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.int64).ravel()
+    np.add.at(acc["histogram"], codes, weights)
+
+    count = int(np.sum(weights))
+    if count > 0:
+        values = codes / acc["scale"]
+        mean = float(np.sum(weights * values)) / count
+        m2 = float(np.sum(weights * (values - mean) ** 2))
+        combine_moments(acc, count, mean, m2)
+    return acc
+
+
+def merge(acc, other):
+    # Add the statistics of other to acc, as if other's data had been added.
+    if acc["scale"] != other["scale"] or \
+            len(acc["histogram"]) != len(other["histogram"]):
+        raise ValueError("Accumulators of different bins or scales.")
+    acc["histogram"] += other["histogram"]
+    combine_moments(acc, other["count"], other["mean"], other["m2"])
+    return acc
+
+
+def moments(acc):
+    # (count, mean, population sd) of the values.
+    if acc["count"] == 0:
+        return (0, float("nan"), float("nan"))
+    return (acc["count"], acc["mean"], np.sqrt(acc["m2"] / acc["count"]))
+
+
+def count_at_most(acc, code):
+    # How many codes are not greater than code.
+    return int(np.sum(acc["histogram"][:max(code + 1, 0)]))
+
+
+def sample(acc):
+    # The weighted sample the cutoff methods take, without expanding data.
+    return weighted_sample.from_histogram(acc["histogram"], acc["scale"])
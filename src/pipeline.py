@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import functools
+import calculate_simi
+import extract_singletons
+import extract_triple_dis
+import table_cache
+import species_pool
+import input_stream
+
+
+# The stage stamps are kept in the (ignored) cache directory, next to the
+# cached tables, rather than among the results.
+STAMP_DIR = os.path.join(table_cache.CACHE_DIR, "pipeline")
+# Every module the stages import, their own scripts and those they import
+# in turn, lazily or not. A change in any of them may change the outputs,
+# thus each stage depends on them all.
+STAGE_MODULES = ["calculate_simi", "extract_singletons", "extract_triple_dis",
+                 "bootstrap", "cutoff_binormal", "dag_parser",
+                 "find_gmm_cutoff", "fit", "fit_gmm", "gff_parser",
+                 "input_stream", "online_stats", "species_pool",
+                 "table_cache", "weighted_sample"]
+
+
+def source_files(current_dir, names):
+    return [os.path.join(current_dir, name + ".py") for name in names]
+
+
+def species_stages(species, current_dir, directory, settings):
+    """
+    The stages of one species in order. A stage declares its input files,
+    the scripts it runs as inputs as well, its output files and the
+    settings it depends on.
+    """
+    dag_input_file = os.path.join(current_dir, species)
+    gff_input_file = extract_singletons.gff_file(current_dir, species) or \
+        os.path.join(current_dir, "../data/gff/",
+                     input_stream.species_name(species) + ".gff")
+    output_prefix = os.path.join(current_dir, directory,
+                                 input_stream.species_name(species))
+    binormal_cutoff_paras_files = output_prefix + '.binormal_cutoff.parameters'
+
+    def run_pairs():
+        calculate_simi.extract_pairs(dag_input_file, output_prefix,
+                                     settings["parse_jobs"],
+                                     settings["expand_similarity"])
+
+    def run_cutoffs():
+        table = table_cache.load_dag(dag_input_file, settings["parse_jobs"])
+        blocks_avg_sim, block_simis = calculate_simi.summarize_blocks(table)
+        calculate_simi.find_cutoffs(blocks_avg_sim, block_simis,
+                                    output_prefix, settings["n_bootstrap"],
+                                    settings["binormal_mode"])
+
+    def run_singletons():
+        table = table_cache.load_dag(dag_input_file, settings["parse_jobs"])
+        gff_table = table_cache.load_gff(gff_input_file)
+        extract_singletons.execute_species(table, gff_table,
+                                           output_prefix + '.dag',
+                                           binormal_cutoff_paras_files,
+                                           current_dir, directory, species,
+                                           settings["seqtypes"],
+                                           settings["legacy_singletons"])
+
+    def run_triplets():
+        extract_triple_dis.extract_species_triples(dag_input_file,
+                                                   output_prefix,
+                                                   settings["parse_jobs"])
+
+    singleton_outputs = [output_prefix + '.dag']
+    for seqtype in settings["seqtypes"]:
+        for half in ["", ".2"]:
+            gff_output_file, singleton_stat_file, singletons_between_file = \
+                extract_singletons.half_files(current_dir, directory,
+                                              species, seqtype, half)
+            singleton_outputs += [gff_output_file,
+                                  f"{gff_output_file}.in",
+                                  f"{gff_output_file}.not",
+                                  f"{gff_output_file}.forstat",
+                                  singleton_stat_file,
+                                  singletons_between_file]
+
+    sources = source_files(current_dir, STAGE_MODULES)
+    return [
+        {
+            "name": "pairs",
+            "inputs": [dag_input_file] + sources,
+            "outputs": [output_prefix + '.similarity'],
+            "params": {"expand_similarity": settings["expand_similarity"]},
+            "run": run_pairs,
+        },
+        {
+            "name": "cutoffs",
+            "inputs": [dag_input_file] + sources,
+            "outputs": [output_prefix + '.fit_gmm.parameters',
+                        output_prefix + '.gmm_cutoff.parameters',
+                        binormal_cutoff_paras_files,
+                        output_prefix + '.similarity.t1',
+                        output_prefix + '.between.similarity.t1'],
+            "params": {"n_bootstrap": settings["n_bootstrap"],
+                       "binormal_mode": settings["binormal_mode"]},
+            "run": run_cutoffs,
+        },
+        {
+            "name": "singletons",
+            "inputs": [dag_input_file, gff_input_file,
+                       binormal_cutoff_paras_files] + sources,
+            "outputs": singleton_outputs,
+            "params": {"seqtypes": settings["seqtypes"],
+                       "legacy_singletons": settings["legacy_singletons"]},
+            "run": run_singletons,
+        },
+        {
+            "name": "triplets",
+            "inputs": [dag_input_file, binormal_cutoff_paras_files] + sources,
+            "outputs": [output_prefix + '.triplets',
+                        output_prefix + '.triplets.t1'],
+            "params": {},
+            "run": run_triplets,
+        },
+    ]
+
+
+def read_stamp(stamp_file):
+    try:
+        with open(stamp_file, 'r') as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return None
+
+
+def is_up_to_date(stage, stamp_file):
+    # The outputs exist, are newer than all the inputs, and were made
+    # with the same settings.
+    for output_file in stage["outputs"]:
+        if not os.path.isfile(output_file):
+            return False
+    if read_stamp(stamp_file) != stage["params"]:
+        return False
+    newest_input = max(os.path.getmtime(input_stream.source_path(f))
+                       for f in stage["inputs"])
+    oldest_output = min(os.path.getmtime(f) for f in stage["outputs"])
+    return oldest_output >= newest_input
+
+
+def run_species(species, current_dir, directory, settings):
+    # Run the out of date stages of one species, in order. Return
+    # (stage, status, seconds) for each stage.
+    os.makedirs(STAMP_DIR, exist_ok=True)
+    name = input_stream.species_name(species)
+
+    results = []
+    for stage in species_stages(species, current_dir, directory, settings):
+        missing = [f for f in stage["inputs"]
+                   if not os.path.isfile(input_stream.source_path(f))]
+        if len(missing) > 0:
+            print(f"No input {missing[0]} for {stage['name']} of {name}, skip.")
+            results.append((stage["name"], "missing", 0.0))
+            continue
+
+        stamp_file = os.path.join(STAMP_DIR, f"{name}.{stage['name']}.json")
+        if is_up_to_date(stage, stamp_file):
+            results.append((stage["name"], "skipped", 0.0))
+            continue
+
+        print(f"****** {stage['name']} of {name}. ******")
+        start = time.perf_counter()
+        stage["run"]()
+        elapsed = time.perf_counter() - start
+        with open(stamp_file, 'w') as fout:
+            json.dump(stage["params"], fout)
+        results.append((stage["name"], "run", elapsed))
+    return results
+
+
+def print_summary(species_list, all_results):
+    print(f"\n===================  Stage timing  ===================")
+    print("Stage\tRun\tSkipped\tMissing\tSeconds")
+    summary = {}
+    for results in all_results:
+        for stage_name, status, elapsed in results:
+            if stage_name not in summary:
+                summary[stage_name] = {"run": 0, "skipped": 0,
+                                       "missing": 0, "seconds": 0.0}
+            summary[stage_name][status] += 1
+            summary[stage_name]["seconds"] += elapsed
+    for stage_name, stat in summary.items():
+        print(f"{stage_name}\t{stat['run']}\t{stat['skipped']}\t"
+              f"{stat['missing']}\t{stat['seconds']:.2f}")
+
+    for species, results in zip(species_list, all_results):
+        total = sum(elapsed for _, _, elapsed in results)
+        ran = [stage_name for stage_name, status, _ in results
+               if status == "run"]
+        print(f"{input_stream.species_name(species)}\t{total:.2f}s\t"
+              f"{','.join(ran) if ran else 'up to date'}")
+
+
+def main(args):
+    # The species are independent, --jobs N runs N of them at once, all
+    # the cores by default.
+    args, jobs = species_pool.parse_jobs(args, default=0)
+    species_list = input_stream.parse_species_list(args)
+    if species_list is None or len(species_list) <= 0:
+        print("No valid input.")
+        return
+
+    print(f"\n===================  Pipeline.  ===================")
+    print(f"The program will deal with the following files: {species_list}.\n")
+
+    # Check the output directory.
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    directory = "../output"
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    settings = {
+        # Bootstrap replicates for the intervals of the cutoffs, 0 to skip.
+        "n_bootstrap": 0,
+        # "grid" or "unique", see cutoff_binormal.search_node
+        "binormal_mode": "grid",
+        "seqtypes": ["gene", "CDS"],
+        # True takes the flanks of the singletons from their batches in the
+        # gff file order, as before the sweep.
+        "legacy_singletons": False,
+        # True writes the legacy .similarity, one row per anchor pair.
+        "expand_similarity": False,
+        # processes to parse one dag file with, not part of the stamps
+        "parse_jobs": species_pool.jobs_per_species(jobs, len(species_list)),
+    }
+    worker = functools.partial(run_species, current_dir=current_dir,
+                               directory=directory, settings=settings)
+    all_results = species_pool.map_species(worker, species_list, jobs)
+
+    print_summary(species_list, all_results)
+    print(f"Mission completed. Please check the results in {directory} folder.")
+
+
+if __name__ == "__main__":
+    # python3 pipeline.py ../data/paralogs_outputs/
+    main(sys.argv)
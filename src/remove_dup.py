@@ -1,6 +1,7 @@
 import os
 import sys
-import calculate_simi
+import dag_parser
+import input_stream
 
 
 def calculate_common_ratio(list1, list2):
@@ -15,133 +16,130 @@ def calculate_common_ratio(list1, list2):
     return ratio
 
 
+def counted_block_ids(headers, n_blocks):
+    # The ids the blocks are judged by: counted from 1 in the file order,
+    # and back to 1 when the header of the next block starts with "#1",
+    # which "#10" does as well. The block id thus shifts to 1 for the last
+    # block in a genome pair, which doesn't affect the result.
+    block_ids = []
+    block_id = 1
+    for i in range(n_blocks):
+        if i + 1 < len(headers) and headers[i + 1].startswith("#1"):
+            block_id = 1
+        block_ids.append(block_id)
+        block_id += 1
+    return block_ids
+
+
+def copy_lines(dag_input_file, kept_ranges, block_ends, fout):
+    """
+    Copy the lines starting in the kept (start, stop) byte ranges to fout,
+    stripped and without the blank ones. block_ends are the offsets the
+    judged blocks end at, a "#Ks" line without a block before it since the
+    last one, i.e. the first one, is reported and skipped as it used to be.
+    """
+    row_id = 0
+    offset = 0
+    range_index = 0
+    end_index = 0
+    block_closed = False
+    for raw_line in input_stream.read_lines(dag_input_file):
+        row_id += 1
+        line_start = offset
+        offset += len(raw_line)
+
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        while end_index < len(block_ends) and \
+                block_ends[end_index] <= line_start:
+            end_index += 1
+            block_closed = True
+        if line.startswith(b"#Ks"):
+            if not block_closed:
+                print(f"Skip line {row_id} which should be the starting.")
+            block_closed = False
+
+        while range_index < len(kept_ranges) and \
+                kept_ranges[range_index][1] <= line_start:
+            range_index += 1
+        if range_index < len(kept_ranges) and \
+                kept_ranges[range_index][0] <= line_start:
+            fout.write(line + b"\n")
+
+
 def remove_dag_dup(dag_input_file, dag_output_file, 
                    dup_threshold = 0.9, debug_rows_count = 0):
-    
-    with open(dag_input_file, 'r') as fin, \
-        open(dag_output_file, 'w') as fout:
-        
-        # global initialization
-        row_id = 0
-        genome_default = "CURR"
-        genome_default_2 = "CURR_2"
-
-        # block initialization
-        current_genome_seq = genome_default
-        current_genome_seq_2 = genome_default_2
-        block_seqs_dict = {}
-        block_count = 0
-        block_id = 1
-        block_fids = []
-        
-        # store line batch
-        curlines = []
-
-        for line in fin:
-            row_id += 1
-            line = line.strip()
-
-            # For debug
-            if debug_rows_count > 0 and row_id == debug_rows_count:
-                break
-            
-            if not line:
-                continue
-            curlines.append(line)
-
-            # If starts with "#", new block starts.
-            if line.startswith("#Ks"):
-                if block_count <= 0:
-                    print(f"Skip line {row_id} which should be the starting.")
-                    continue
-                
-                genomes = (current_genome_seq, current_genome_seq_2)
-                if genomes not in block_seqs_dict:
-                    block_seqs_dict[genomes] = {}
-                if block_id not in block_seqs_dict[genomes]:
-                    block_seqs_dict[genomes][block_id] = block_fids
-                    for aline in curlines:
-                        fout.write(f"{aline}\n")
-                else:
-                    # Judge the duplication.
-                    old_fids = block_seqs_dict[genomes][block_id]
-                    dup_ratio = calculate_common_ratio(block_fids, old_fids)
-                    # print(f"dup_ratio = {dup_ratio}")
-                    if dup_ratio < dup_threshold:
-                        for aline in curlines:
-                            fout.write(f"{aline}\n")
-                    else:
-                        print(f"Duplicates in {genomes}, block_id = {block_id}, ratio = {dup_ratio}")
-    
-                # re-init
-                current_genome_seq = genome_default
-                current_genome_seq_2 = genome_default_2
-                block_fids = []
-                block_count = 0
-                curlines = []
-
-                # For the next block
-                block_id += 1
-            
-            # new genome pairs signal
-            # The block id will shift to 1 for the last block in a genome pair,
-            # which doesn't affect the result, thus ignore it.
-            if line.startswith("#1"):
-                block_id = 1
-
-            # check data validation
-            fields = line.split('\t')
-            if len(fields) != 12:
-                if not line.startswith("#"):
-                    print(f"Invalid line {row_id} with {len(fields)} fields.")
+    table = dag_parser.drop_mixed_rows(
+        dag_parser.parse_dag(dag_input_file, debug_rows_count))
+    chromosomes = table["chromosomes"]
+    offsets = table["block_offsets"]
+    block_bytes = table["block_bytes"]
+    chr1 = table["chr1"]
+    chr2 = table["chr2"]
+    fid1 = table["fid1"]
+    fid2 = table["fid2"]
+
+    n_judged = dag_parser.closed_block_count(table)
+    block_ids = counted_block_ids(table["headers"], n_judged)
+
+    block_seqs_dict = {}
+    kept_ranges = []
+    with open(dag_output_file, 'wb') as fout:
+        for i in range(dag_parser.block_count(table)):
+            start = offsets[i]
+            stop = offsets[i + 1]
+
+            # A block is judged at the "#" line after it, thus the block
+            # at the very end of the file is kept as it is.
+            if i >= n_judged:
+                kept_ranges.append((int(block_bytes[i]), int(block_bytes[i + 1])))
                 continue
 
-            # chr1||start1||stop1||name1||strand1||type1||db_feature_id1||genome_order1||percent_id1
-            # chr2||start2||stop2||name2||strand2||type2||db_feature_id2||genome_order2||percent_id2
-            chain_info = fields[3].split('||')
-            chain_info_2 = fields[7].split('||')
-            if len(chain_info) != 9 or len(chain_info_2) != 9:
-                print(f"Invalid line {row_id} with fault \
-                      columns for the two genome sequence.")
-                continue
-            
-            genome_seq = chain_info[0]
-            genome_seq_2 = chain_info_2[0]
-            if genome_seq > genome_seq_2: # rank by alphabet order
+            # the chromosome ids of the table
+            genome_seq = int(chr1[start])
+            genome_seq_2 = int(chr2[start])
+            # rank by alphabet order
+            if chromosomes[genome_seq] > chromosomes[genome_seq_2]:
                 tmp = genome_seq
                 genome_seq = genome_seq_2
                 genome_seq_2 = tmp
-            # The genome sequence within a block should be the same.
-            if current_genome_seq != genome_default \
-                and genome_seq != current_genome_seq:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence within current block")
-                continue
-            if current_genome_seq_2 != genome_default_2 \
-                and genome_seq_2 != current_genome_seq_2:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence 2 within current block")
-                continue
-
-            current_genome_seq = genome_seq
-            current_genome_seq_2 = genome_seq_2
+            genomes = (genome_seq, genome_seq_2)
+
+            block_id = block_ids[i]
+            block_fids = []
+            for fid_1, fid_2 in zip(fid1[start:stop].tolist(), 
+                                    fid2[start:stop].tolist()):
+                if fid_1 <= fid_2:
+                    block_fids.append((fid_1, fid_2))
+                else:
+                    block_fids.append((fid_2, fid_1))
 
-            fid_1 = chain_info[6]
-            fid_2 = chain_info_2[6]
-            if fid_1 <= fid_2:
-                block_fids.append((fid_1, fid_2))
+            if genomes not in block_seqs_dict:
+                block_seqs_dict[genomes] = {}
+            if block_id not in block_seqs_dict[genomes]:
+                block_seqs_dict[genomes][block_id] = block_fids
             else:
-                block_fids.append((fid_2, fid_1))
+                # Judge the duplication.
+                old_fids = block_seqs_dict[genomes][block_id]
+                dup_ratio = calculate_common_ratio(block_fids, old_fids)
+                # print(f"dup_ratio = {dup_ratio}")
+                if dup_ratio >= dup_threshold:
+                    names = (chromosomes[genome_seq], chromosomes[genome_seq_2])
+                    print(f"Duplicates in {names}, block_id = {block_id}, ratio = {dup_ratio}")
+                    continue
+
+            # Copy the lines of the block, headers included.
+            kept_ranges.append((int(block_bytes[i]), int(block_bytes[i + 1])))
 
-            block_count += 1
-        
-        if len(curlines) > 0:
-            for aline in curlines:
-                fout.write(f"{aline}\n")
+        # in one pass, as a compressed input can only be streamed
+        block_ends = block_bytes[1:n_judged + 1].tolist()
+        copy_lines(dag_input_file, kept_ranges, block_ends, fout)
 
 
 def main(args):
-    species_list = calculate_simi.parse_species_list(args)
+    species_list = input_stream.parse_species_list(args)
     if species_list is None or len(species_list) <= 0:
         print("No valid input.")
         return
@@ -157,11 +155,12 @@ def main(args):
 
     # species_list = ['rainbow_trout', 'chum_salmon']
     for species in species_list:
-        print(f"****** Start dealing with {os.path.basename(species)}. ******")
+        print(f"****** Start dealing with {input_stream.species_name(species)}. ******")
 
         input_file = os.path.join(current_dir, species)
+        # the output is not compressed
         output_file = os.path.join(current_dir, directory, 
-                                   os.path.basename(species))
+                                   input_stream.species_name(species))
         remove_dag_dup(input_file, output_file)
 
 
@@ -0,0 +1,122 @@
+import io
+import os
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import input_stream
+
+
+# Rough peak memory of a worker: the interpreter with numpy (and scipy or
+# matplotlib when a plot is asked for) loaded, plus the parsed tables and
+# dicts of its inputs.
+WORKER_BASE_BYTES = 200 * 1024 ** 2
+BYTES_PER_INPUT_BYTE = 20
+# Share of the available memory the workers may take together.
+MEMORY_SHARE = 0.5
+
+
+def parse_jobs(args, default = 1):
+    """
+    Take "--jobs N" (or "--jobs=N") out of args. Return the remaining args
+    and N, default without the flag. 1 runs one species at a time in this
+    process, 0 runs as many as there are cores.
+    """
+    rest = []
+    jobs = default
+    i = 0
+    while i < len(args):
+        if args[i] == "--jobs" and i + 1 < len(args):
+            jobs = int(args[i + 1])
+            i += 2
+            continue
+        if args[i].startswith("--jobs="):
+            jobs = int(args[i].split("=", 1)[1])
+        else:
+            rest.append(args[i])
+        i += 1
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return rest, jobs
+
+
+def jobs_per_species(jobs, n_species):
+    # The cores left to each species, e.g. to parse a single large one.
+    return max(1, jobs // max(1, n_species))
+
+
+def available_memory():
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def footprint(file_paths):
+    # Estimated peak memory of a worker reading these files.
+    size = 0
+    for file_path in file_paths:
+        # A tar member is no file, and its archive holds the others too.
+        if file_path is not None and os.path.isfile(file_path):
+            size += os.path.getsize(file_path)
+    return WORKER_BASE_BYTES + BYTES_PER_INPUT_BYTE * size
+
+
+def run_captured(worker, species):
+    # The worker's prints are returned to be shown in the species order.
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        result = worker(species)
+    return out.getvalue(), result
+
+
+def map_species(worker, species_list, jobs = 1, footprints = None,
+                budget = None):
+    """
+    worker(species) for every species, jobs of them at once in worker
+    processes, and no more than fit in the memory budget by their estimated
+    footprints (one always runs). worker must be picklable, e.g. a
+    module-level function or a functools.partial of one. The prints of
+    every species and the results come out in the order of species_list.
+    """
+    if jobs <= 1 or len(species_list) <= 1:
+        return [worker(species) for species in species_list]
+
+    if footprints is None:
+        footprints = [footprint([species]) for species in species_list]
+    if budget is None:
+        budget = available_memory()
+        budget = float('inf') if budget is None else budget * MEMORY_SHARE
+
+    results = [None] * len(species_list)
+    done = [False] * len(species_list)
+    next_print = 0
+    next_submit = 0
+    running = {}
+    in_use = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while next_print < len(species_list):
+            # Start more species while cores and memory are left.
+            while next_submit < len(species_list) and len(running) < jobs and \
+                    (len(running) == 0 or
+                     in_use + footprints[next_submit] <= budget):
+                future = executor.submit(run_captured, worker,
+                                         species_list[next_submit])
+                running[future] = next_submit
+                in_use += footprints[next_submit]
+                next_submit += 1
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                in_use -= footprints[i]
+                results[i] = future.result()
+                done[i] = True
+
+            # Show the finished species in order.
+            while next_print < len(species_list) and done[next_print]:
+                text, results[next_print] = results[next_print]
+                print(f"[{next_print + 1}/{len(species_list)}] "
+                      f"{input_stream.species_name(species_list[next_print])}")
+                print(text, end="")
+                next_print += 1
+
+    return results
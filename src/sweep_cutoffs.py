@@ -0,0 +1,199 @@
+import os
+import sys
+import functools
+import numpy as np
+import calculate_simi
+import dag_parser
+import extract_singletons
+import extract_triple_dis
+import table_cache
+import species_pool
+import input_stream
+
+
+def pid_limits(cutoffs, n_pids = 1, digits = None):
+    # The integer limit of every cutoff, see dag_parser.pid_cutoff, the
+    # cutoffs rounded to digits first as some stages do.
+    limits = []
+    for cutoff in cutoffs:
+        if digits is not None:
+            cutoff = round(cutoff, digits)
+        limits.append(dag_parser.pid_cutoff(cutoff, n_pids))
+    return np.array(limits, dtype=np.int64)
+
+
+def count_at_most(sorted_keys, limits, weights = None):
+    # For every limit, how many of the sorted keys are not greater than it,
+    # or the sum of their weights.
+    positions = np.searchsorted(sorted_keys, limits, side='right')
+    if weights is None:
+        return positions
+    return np.r_[0, np.cumsum(weights)][positions]
+
+
+def sweep_pairs(table, cutoffs):
+    """
+    The t1 and t2 counts of stat_pair_t1 and stat_pair_between_t1 for all
+    the cutoffs, as (metric, class, counts) rows. The anchor pairs of a
+    block are on the side of its rounded similarity, the between pairs on
+    the side of the average of their two identities.
+    """
+    blocks_avg_sim, block_simis = calculate_simi.summarize_blocks(table)
+    pids = np.array(calculate_simi.block_pids(blocks_avg_sim), dtype=np.int64)
+    sizes = np.array([block[2] for block in blocks_avg_sim], dtype=np.int64)
+    order = np.argsort(pids, kind='stable')
+    t1 = count_at_most(pids[order], pid_limits(cutoffs), sizes[order])
+    total = int(np.sum(sizes))
+    rows = [("pairs", "t1", t1), ("pairs", "t2", total - t1)]
+
+    pid_sums = np.sort(calculate_simi.between_pid_sums(block_simis))
+    t1 = count_at_most(pid_sums, pid_limits(cutoffs, 2))
+    rows += [("between_pairs", "t1", t1),
+             ("between_pairs", "t2", len(pid_sums) - t1)]
+    return rows
+
+
+def singleton_pid_sums(rows):
+    # The identity sums of the singletons within a block, which calculate_t
+    # counts, from the singleton_rows of extract_singletons.
+    pid_sums = []
+    for row in rows:
+        fields = row.split("\t")
+        if len(fields) != 12:
+            continue
+        pid_sum = extract_singletons.singleton_pid_sum(fields)
+        if pid_sum is not None:
+            pid_sums.append(pid_sum)
+    return np.sort(np.array(pid_sums, dtype=np.int64))
+
+
+def load_gff_table(current_dir, species):
+    # The gff table of the species, None without its gff file.
+    gff_input_file = extract_singletons.gff_file(current_dir, species)
+    if gff_input_file is None:
+        return None
+    try:
+        return table_cache.load_gff(gff_input_file)
+    except FileNotFoundError:
+        # not in the archive
+        return None
+
+
+def sweep_singletons(table, gff_table, seqtypes, cutoffs):
+    # The t1 and t2 counts of calculate_t for every (seqtype, half), the
+    # singletons found from the tables as extract_singletons does.
+    rows = []
+    limits = pid_limits(cutoffs, 2)
+    table = dag_parser.drop_mixed_rows(table)
+    for seqtype in seqtypes:
+        features = extract_singletons.gff_features(gff_table, [seqtype], 
+                                                   table["chromosomes"])
+        for half, extract_first in [("", True), (".2", False)]:
+            on_chromosome, anchors = extract_singletons.feature_anchors(
+                table, features, extract_first)
+            pid_sums = singleton_pid_sums(extract_singletons.singleton_rows(
+                table, features, on_chromosome, anchors, extract_first))
+            t1 = count_at_most(pid_sums, limits)
+            metric = f"singletons.{seqtype}{half}"
+            rows += [(metric, "t1", t1), (metric, "t2", len(pid_sums) - t1)]
+    return rows
+
+
+def sweep_triplets(triples, cutoffs):
+    """
+    The .triplets.t1 histogram for all the cutoffs: a triplet has at least
+    k t1 pairs when its k-th smallest identity is within the cutoff, so
+    each of the three is sorted once over the triplets.
+    """
+    sims = np.sort(np.asarray(triples["sims"], dtype=np.int64), axis=1)
+    limits = pid_limits(cutoffs, digits=2)
+    at_least = [np.full(len(limits), len(sims), dtype=np.int64)]
+    for k in range(3):
+        at_least.append(count_at_most(np.sort(sims[:, k]), limits))
+    at_least.append(np.zeros(len(limits), dtype=np.int64))
+
+    rows = []
+    for t1_count in range(4):
+        rows.append(("triplets", str(t1_count),
+                     at_least[t1_count] - at_least[t1_count + 1]))
+    return rows
+
+
+def save_sweep(output_file, species_name, cutoffs, rows):
+    # A tidy table, one count per line.
+    with open(output_file, 'w') as fout:
+        fout.write("Species\tMetric\tCutoff\tClass\tCount\n")
+        for metric, t_class, counts in rows:
+            for cutoff, count in zip(cutoffs, counts.tolist()):
+                fout.write(f"{species_name}\t{metric}\t{cutoff}\t"
+                           f"{t_class}\t{count}\n")
+
+
+def sweep_species(species, current_dir, directory, cutoffs,
+                  seqtypes = ["gene", "CDS"], parse_jobs = 1):
+    name = input_stream.species_name(species)
+    print(f"****** Start dealing with {name}. ******")
+    input_file = os.path.join(current_dir, species)
+    output_prefix = os.path.join(current_dir, directory, name)
+
+    # The binormal cutoff of the species is swept as well.
+    cutoff_para_file = output_prefix + '.binormal_cutoff.parameters'
+    if os.path.isfile(cutoff_para_file):
+        best_cutoff = extract_singletons.parse_cutoff(cutoff_para_file)
+        if best_cutoff != -1 and best_cutoff not in cutoffs:
+            cutoffs = sorted(cutoffs + [best_cutoff])
+
+    table = table_cache.load_dag(input_file, parse_jobs)
+    rows = sweep_pairs(table, cutoffs)
+    gff_table = load_gff_table(current_dir, species)
+    if gff_table is None:
+        print(f"No gff file for {species}, no singletons swept.")
+    else:
+        rows += sweep_singletons(table, gff_table, seqtypes, cutoffs)
+    rows += sweep_triplets(extract_triple_dis.load_triples(input_file,
+                                                           parse_jobs),
+                           cutoffs)
+
+    output_file = output_prefix + '.cutoff_sweep'
+    save_sweep(output_file, name, cutoffs, rows)
+    print(f"{len(cutoffs)} cutoffs of {len(rows)} counts saved to {output_file}.")
+
+
+def main(args):
+    # --jobs N runs N species at once
+    args, jobs = species_pool.parse_jobs(args)
+    species_list = input_stream.parse_species_list(args)
+    if species_list is None or len(species_list) <= 0:
+        print("No valid input.")
+        return
+
+    print(f"\n===================  Sweep cutoffs.  ===================")
+    print(f"The program will deal with the following files: {species_list}.\n")
+
+    # Check the output directory.
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    directory = "../output"
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # The cutoffs from sweep_start to sweep_stop by sweep_step, with the
+    # binormal cutoff of each species. The singletons are counted for
+    # these seqtypes.
+    sweep_start = 60.0
+    sweep_stop = 100.0
+    sweep_step = 0.1
+    cutoffs = np.round(np.arange(sweep_start, sweep_stop + sweep_step / 2,
+                                 sweep_step), 2).tolist()
+    seqtypes = ["gene", "CDS"]
+
+    worker = functools.partial(sweep_species, current_dir=current_dir,
+                               directory=directory, cutoffs=cutoffs,
+                               seqtypes=seqtypes,
+                               parse_jobs=species_pool.jobs_per_species(
+                                   jobs, len(species_list)))
+    species_pool.map_species(worker, species_list, jobs)
+
+
+if __name__ == "__main__":
+    # python3 sweep_cutoffs.py ../data/paralogs_outputs/
+    main(sys.argv)
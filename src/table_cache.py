@@ -0,0 +1,172 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import dag_parser
+import gff_parser
+import input_stream
+
+
+# The cache lives next to the output directory.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../cache")
+# Least recently used entries are evicted beyond this size.
+CACHE_MAX_BYTES = 8 * 1024 ** 3
+
+META_FILE = "meta.json"
+
+
+def hash_file(file_path, chunk_size = 1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as fin:
+        chunk = fin.read(chunk_size)
+        while chunk:
+            digest.update(chunk)
+            chunk = fin.read(chunk_size)
+    return digest.hexdigest()
+
+
+def entry_dir(cache_dir, kind, file_path, options):
+    key = f"{kind}\t{os.path.abspath(file_path)}\t{options}"
+    name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, f"{kind}.{name}")
+
+
+def read_meta(entry):
+    try:
+        with open(os.path.join(entry, META_FILE), 'r') as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(meta, version, file_path, file_stat):
+    """
+    An entry is valid while the version of the table layout and the size
+    of the input file are the same and either the mtime or, failing that,
+    the content hash matches. For a tar member, that is the whole archive.
+    """
+    if meta is None or meta["version"] != version:
+        return False
+    if meta["size"] != file_stat.st_size:
+        return False
+    if meta["mtime_ns"] == file_stat.st_mtime_ns:
+        return True
+    return meta["hash"] == hash_file(file_path)
+
+
+def load_entry(entry, meta):
+    table = dict(meta["values"])
+    for name in meta["arrays"]:
+        table[name] = np.load(os.path.join(entry, f"{name}.npy"),
+                              mmap_mode='r')
+    # mark it as recently used
+    os.utime(os.path.join(entry, META_FILE))
+    return table
+
+
+def save_entry(entry, table, version, file_path, file_stat):
+    meta = {
+        "version": version,
+        "file_path": os.path.abspath(file_path),
+        "size": file_stat.st_size,
+        "mtime_ns": file_stat.st_mtime_ns,
+        "hash": hash_file(file_path),
+        "arrays": [],
+        "values": {},
+    }
+
+    tmp_entry = f"{entry}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_entry, ignore_errors=True)
+    os.makedirs(tmp_entry)
+    for name, value in table.items():
+        if isinstance(value, np.ndarray):
+            np.save(os.path.join(tmp_entry, f"{name}.npy"), value)
+            meta["arrays"].append(name)
+        else:
+            meta["values"][name] = value
+    with open(os.path.join(tmp_entry, META_FILE), 'w') as fout:
+        json.dump(meta, fout)
+
+    # Replace the stale entry, if any. Another process may have stored
+    # the same entry in the meantime, which is fine to keep.
+    shutil.rmtree(entry, ignore_errors=True)
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+
+def entry_size(entry):
+    size = 0
+    for name in os.listdir(entry):
+        size += os.path.getsize(os.path.join(entry, name))
+    return size
+
+
+def evict(cache_dir, max_bytes, keep = None):
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        meta_file = os.path.join(entry, META_FILE)
+        if not os.path.isfile(meta_file):
+            continue
+        size = entry_size(entry)
+        total += size
+        entries.append((os.path.getmtime(meta_file), size, entry))
+
+    # least recently used first
+    entries.sort()
+    for _, size, entry in entries:
+        if total <= max_bytes:
+            break
+        if entry == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def load(kind, file_path, parse, version, options = "",
+         cache_dir = CACHE_DIR, max_bytes = CACHE_MAX_BYTES):
+    """
+    Return the table parsed from file_path, from the cache if the entry
+    is still valid, otherwise parse it and store it in the cache.
+    """
+    if max_bytes <= 0:
+        return parse()
+
+    source = input_stream.source_path(file_path)
+    file_stat = os.stat(source)
+    entry = entry_dir(cache_dir, kind, file_path, options)
+    meta = read_meta(entry)
+    if is_fresh(meta, version, source, file_stat):
+        if meta["mtime_ns"] != file_stat.st_mtime_ns:
+            # Same content with a new mtime, avoid hashing it next time.
+            meta["mtime_ns"] = file_stat.st_mtime_ns
+            with open(os.path.join(entry, META_FILE), 'w') as fout:
+                json.dump(meta, fout)
+        return load_entry(entry, meta)
+
+    table = parse()
+    os.makedirs(cache_dir, exist_ok=True)
+    save_entry(entry, table, version, source, file_stat)
+    evict(cache_dir, max_bytes, keep=entry)
+    return table
+
+
+def load_dag(file_path, jobs = 1, cache_dir = CACHE_DIR, 
+             max_bytes = CACHE_MAX_BYTES):
+    # jobs > 1 parses the file in that many processes, to the same table.
+    return load("dag", file_path,
+                lambda: dag_parser.parse_dag(file_path, jobs=jobs),
+                dag_parser.TABLE_VERSION,
+                cache_dir=cache_dir, max_bytes=max_bytes)
+
+
+def load_gff(file_path, seqtypes = gff_parser.DEFAULT_SEQTYPES,
+             cache_dir = CACHE_DIR, max_bytes = CACHE_MAX_BYTES):
+    return load("gff", file_path,
+                lambda: gff_parser.parse_gff_table(file_path, seqtypes),
+                gff_parser.TABLE_VERSION, options=",".join(seqtypes),
+                cache_dir=cache_dir, max_bytes=max_bytes)
@@ -1,118 +1,46 @@
 import sys
-import calculate_simi
+import dag_parser
 import os
+import input_stream
 
 def parse_dagchainer_output(file_path, debug_rows_count = 0):
-    with open(file_path, 'r') as file:
-        # global initialization
-        row_id = 0
-        blocks_avg_sim = []
-        genome_default = "CURR"
-        genome_default_2 = "CURR_2"
-
-        # block initialization
-        current_genome_seq = genome_default
-        current_genome_seq_2 = genome_default_2
-        block_sim_sum = 0
-        block_count = 0
-        current_block_info_line = None
-
-        for line in file:
-            row_id += 1
-            line = line.strip()
-
-            # For debug
-            if debug_rows_count > 0 and row_id == debug_rows_count:
-                break
-            
-            if not line:
-                continue
-
-            # The first block's original information.
-            if row_id == 2:
-                current_block_info_line = line
-
-            # If starts with "#", new block starts.
-            # Thus calculate the average of last block.
-            if line.startswith("#"):
-                if block_count <= 0:
-                    # print(f"Skip line {row_id} which should be the starting.")
-                    continue
-                
-                # parse block info from block info line
-                block_info = current_block_info_line.strip().\
-                    strip('#').split('\t')
-                next_block_info_line = line
-
-                # calculate the average similarity
-                # Sometimes the block_info is missing.
-                if len(block_info) < 6:
-                    print(f"******** WARNING ********\n\
-                          file_path: {file_path}, Row_id: {row_id}, current_block_info_line:\n{current_block_info_line}")
-                    blocks_avg_sim.append(("NA", "NA", "NA", "NA", "NA", 
-                                       current_genome_seq, 
-                                       current_genome_seq_2, 
-                                       block_count, 
-                                       block_sim_sum / block_count))
-                else:
-                    blocks_avg_sim.append((block_info[0],
-                                        block_info[2],
-                                        block_info[3],
-                                        block_info[4],
-                                        block_info[5].split(" ")[0],
-                                        current_genome_seq, 
-                                        current_genome_seq_2, 
-                                        block_count, 
-                                        block_sim_sum / block_count))
-                    
-                # re-init
-                current_genome_seq = genome_default
-                current_genome_seq_2 = genome_default_2
-                block_sim_sum = 0
-                block_count = 0
-                current_block_info_line = next_block_info_line
-
-            # check data validation
-            fields = line.split('\t')
-            if len(fields) != 12:
-                if not line.startswith("#"):
-                    print(f"Invalid line {row_id} with {len(fields)} fields.")
-                continue
-
-            # chr1||start1||stop1||name1||strand1||type1||db_feature_id1||genome_order1||percent_id1
-            # chr2||start2||stop2||name2||strand2||type2||db_feature_id2||genome_order2||percent_id2
-            chain_info = fields[3].split('||')
-            chain_info_2 = fields[7].split('||')
-            if len(chain_info) != 9 or len(chain_info_2) != 9:
-                print(f"Invalid line {row_id} with fault \
-                      columns for the two genome sequence.")
-                continue
-            # Since the file records paralog, chr1 should be equal to chr2.
-            # if chain_info[0] != chain_info_2[0]:
-            #     print(f"Invalid line {row_id} with different genome comparison.")
-            #     continue
-            
-            genome_seq = chain_info[0]
-            genome_seq_2 = chain_info_2[0]
-            # The genome sequence within a block should be the same.
-            if current_genome_seq != genome_default \
-                and genome_seq != current_genome_seq:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence within current block")
-                continue
-            if current_genome_seq_2 != genome_default_2 \
-                and genome_seq_2 != current_genome_seq_2:
-                print(f"Invalid line {row_id} with \
-                      different genome sequence 2 within current block")
-                continue
-
-            current_genome_seq = genome_seq
-            current_genome_seq_2 = genome_seq_2
-            percent_id1 = float(chain_info[-1])
-            block_sim_sum += percent_id1
-            block_count += 1
-    
-    return blocks_avg_sim
+    return list(summarize_blocks(file_path, debug_rows_count))
+
+
+def summarize_blocks(file_path, debug_rows_count = 0):
+    # One row per block, read one block at a time, so that a whole genome
+    # is summarized in constant memory.
+    block_index = 0
+    for block in dag_parser.iter_blocks(file_path, debug_rows_count):
+        if not block["closed"]:
+            continue
+        block_index += 1
+        simis = dag_parser.pid_value(block["pid1"]).tolist()
+        block_count = len(simis)
+        current_genome_seq = block["genome_seq"]
+        current_genome_seq_2 = block["genome_seq_2"]
+        current_block_info_line = block["header"]
+
+        # calculate the average similarity
+        # Sometimes the block_info is missing.
+        if block["block_size"] is None:
+            print(f"******** WARNING ********\n\
+                  file_path: {file_path}, Block: {block_index}, current_block_info_line:\n{current_block_info_line}")
+            yield ("NA", "NA", "NA", "NA", "NA", 
+                   current_genome_seq, 
+                   current_genome_seq_2, 
+                   block_count, 
+                   sum(simis) / block_count)
+        else:
+            yield (block["block_id"],
+                   block["name1"],
+                   block["name2"],
+                   block["orientation"],
+                   block["block_size"],
+                   current_genome_seq, 
+                   current_genome_seq_2, 
+                   block_count, 
+                   sum(simis) / block_count)
 
 
 def save_similarity(output_file, blocks_avg_sim):
@@ -129,7 +57,7 @@ def save_similarity(output_file, blocks_avg_sim):
             
 
 def main(args):
-    species_list = calculate_simi.parse_species_list(args)
+    species_list = input_stream.parse_species_list(args)
     if species_list is None or len(species_list) <= 0:
         print("No valid input.")
         return
@@ -145,13 +73,11 @@ def main(args):
     # species_list = ['rainbow_trout', 'chum_salmon']
     for species in species_list:
         input_file = os.path.join(current_dir, species)
-        blocks_avg_sim = parse_dagchainer_output(input_file)
-
         # Print extracted chain information
         output_file = os.path.join(current_dir, directory, 
-                                   os.path.basename(species) 
+                                   input_stream.species_name(species) 
                                    + '.similarity')
-        save_similarity(output_file, blocks_avg_sim)
+        save_similarity(output_file, summarize_blocks(input_file))
 
 
 if __name__ == "__main__":
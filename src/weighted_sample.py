@@ -0,0 +1,155 @@
+import numpy as np
+from collections import namedtuple
+
+
+# Sorted unique values and how many times each one occurs in the data.
+WeightedSample = namedtuple("WeightedSample", ["values", "counts"])
+
+
+def from_data(data):
+    values, counts = np.unique(np.asarray(data, dtype=float).ravel(),
+                               return_counts=True)
+    return WeightedSample(values, counts)
+
+
+def from_fixed_point(data, scale):
+    # The sample of non-negative integers standing for data / scale, e.g.
+    # centi-percents, counted by bincount.
+    return from_histogram(np.bincount(np.asarray(data, dtype=np.int64).ravel()),
+                          scale)
+
+
+def from_histogram(histogram, scale):
+    # The sample of a histogram of such integers, histogram[i] the count
+    # of i / scale.
+    histogram = np.asarray(histogram)
+    values = np.flatnonzero(histogram)
+    return WeightedSample(values / scale, histogram[values])
+
+
+def as_sample(data):
+    if isinstance(data, WeightedSample):
+        return data
+    if isinstance(data, dict):
+        # an online_stats accumulator, counted by its histogram
+        return from_histogram(data["histogram"], data["scale"])
+    return from_data(data)
+
+
+def expand(sample):
+    # Back to one entry per data point, for libraries without weights.
+    return np.repeat(sample.values, sample.counts)
+
+
+def size(sample):
+    return int(np.sum(sample.counts))
+
+
+def norm_fit(sample):
+    # Weighted stats.norm.fit, i.e. the mean and the population sd.
+    n = np.sum(sample.counts)
+    mean = np.sum(sample.values * sample.counts) / n
+    var = np.sum(sample.counts * (sample.values - mean) ** 2) / n
+    return (mean, np.sqrt(var))
+
+
+def norm_pdf_sum(sample, mean, sd):
+    # Weighted np.sum(stats.norm.pdf(data, loc=mean, scale=sd)).
+    z = (sample.values - mean) / sd
+    pdf = np.exp(-0.5 * z * z) / (sd * np.sqrt(2 * np.pi))
+    return np.sum(pdf * sample.counts)
+
+
+def split(sample, node):
+    # data < node and data >= node
+    k = np.searchsorted(sample.values, node, side='left')
+    return (WeightedSample(sample.values[:k], sample.counts[:k]),
+            WeightedSample(sample.values[k:], sample.counts[k:]))
+
+
+def gmm_log_prob(params, x):
+    # log(weight_k * N(x | mean_k, covariance_k)) for every x and k
+    x = np.asarray(x, dtype=float).reshape(-1, 1)
+    means = params["means"].reshape(1, -1)
+    variances = params["covariances"].reshape(1, -1)
+    weights = params["weights"].reshape(1, -1)
+    return np.log(weights) - 0.5 * (np.log(2 * np.pi * variances)
+                                    + (x - means) ** 2 / variances)
+
+
+def gmm_score_samples(params, x):
+    # Same as GaussianMixture.score_samples, the log density of each x.
+    log_prob = gmm_log_prob(params, x)
+    top = np.max(log_prob, axis=1, keepdims=True)
+    return (top + np.log(np.sum(np.exp(log_prob - top),
+                                axis=1, keepdims=True)))[:, 0]
+
+
+def init_gmm(sample, n_components):
+    # Deterministic k-means on the unique values, started from evenly
+    # spaced weighted quantiles, as the starting point of EM.
+    cumulative = np.cumsum(sample.counts) / np.sum(sample.counts)
+    quantiles = (np.arange(n_components) + 0.5) / n_components
+    centers = sample.values[np.searchsorted(cumulative, quantiles)]
+    for _ in range(100):
+        labels = np.argmin(np.abs(sample.values.reshape(-1, 1) - centers),
+                           axis=1)
+        resp = np.zeros((len(sample.values), n_components))
+        resp[np.arange(len(sample.values)), labels] = 1.0
+        nk = resp.T @ sample.counts
+        new_centers = np.where(nk > 0,
+                               (resp.T @ (sample.counts * sample.values))
+                               / np.maximum(nk, 1), centers)
+        if np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+    return resp
+
+
+def m_step(sample, resp, reg_covar):
+    weighted_resp = resp * sample.counts.reshape(-1, 1)
+    nk = np.sum(weighted_resp, axis=0) + 10 * np.finfo(float).eps
+    means = (weighted_resp.T @ sample.values) / nk
+    variances = np.sum(weighted_resp * (sample.values.reshape(-1, 1) - means) ** 2,
+                       axis=0) / nk + reg_covar
+    return {
+        "weights": nk / np.sum(nk),
+        "means": means.reshape(-1, 1),
+        "covariances": variances.reshape(-1, 1, 1),
+    }
+
+
+def fit_gmm(sample, n_components = 2, tol = 1e-3, max_iter = 100,
+            reg_covar = 1e-6):
+    """
+    EM for a one dimensional Gaussian mixture, where every unique value
+    counts as many times as it occurs. It gives the model GaussianMixture
+    would fit on the expanded data from the same start, in O(unique values)
+    per iteration. The parameters have the GaussianMixture shapes.
+    """
+    sample = as_sample(sample)
+    params = m_step(sample, init_gmm(sample, n_components), reg_covar)
+
+    n = np.sum(sample.counts)
+    lower_bound = -np.inf
+    for _ in range(max_iter):
+        # E step
+        log_prob = gmm_log_prob(params, sample.values)
+        top = np.max(log_prob, axis=1, keepdims=True)
+        log_norm = top + np.log(np.sum(np.exp(log_prob - top),
+                                       axis=1, keepdims=True))
+        resp = np.exp(log_prob - log_norm)
+
+        # M step
+        params = m_step(sample, resp, reg_covar)
+
+        previous = lower_bound
+        lower_bound = np.sum(log_norm[:, 0] * sample.counts) / n
+        if abs(lower_bound - previous) < tol:
+            break
+
+    # Order the components by their means.
+    order = np.argsort(params["means"][:, 0])
+    for name in params:
+        params[name] = params[name][order]
+    return params
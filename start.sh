@@ -4,19 +4,8 @@
 # It's not necessary to run every time.
 # python3 remove_dup.py "../data/paralogs_outputs.ori/"
 
-# Prelude: Since the gff file is too large, compressed them
-echo "*********************** Prelude: Check the gff files. ***********************\n"
-if [ ! -d "data/gff" ]; then
-	if [ -f "data/gff.tar.gz" ]; then
-		cd data
-		tar -zxvf gff.tar.gz
-		cd ../
-	else
-		echo "No gff.tar.gz found.\n"
-	fi
-else
-	echo "Directory data/gff exists."
-fi
+# The gff files are read from data/gff/, compressed (.gz, .bz2, .xz) or not,
+# or straight from data/gff.tar.gz, so there is no need to extract them.
 
 ## Set the input folder or file.
 input_path="../data/paralogs_outputs/"
@@ -35,12 +24,8 @@ fi
 # ## Execute the script.
 cd src
 echo "\n============================= PROCESSING ============================="
-echo "\n************** pair ***************"
-python3 calculate_simi.py "$input_path"
-echo "\n************** singleton ***************"
-python3 extract_singletons.py "$input_path"
-echo "\n************** triplet ***************"
-python3 extract_triple_dis.py "$input_path"
+# pairs, cutoffs, singletons and triplets, only the out of date ones.
+python3 pipeline.py "$input_path"
 cd ..
 
 # # print results